@@ -15,6 +15,7 @@ __author__ 	= "Dario Fiumicello"
 __email__ 	= "dario.fiumicello@gmail.com"
 
 import time
+import threading
 from gpspoll.gpspoll import GPSPoll
 from parsers import *
 from consumers import *
@@ -28,6 +29,24 @@ from utils import *
 # This is for debug purposes only, can be removed once system is in production
 import pdb
 
+""" Payload format used by the VI dongle. 'protobuf' is lighter on both the
+Bluetooth link and the CPU, but the dongle firmware must be configured to send
+binary payloads. In that case CAN payloads are handed to the parsers as raw
+bytes, skipping any hex conversion.
+If None, the format is detected from the first data received and cached
+together with the dongle address, so that reconnections skip the detection.
+"""
+VI_PAYLOAD_FORMAT = 'json'
+
+""" Seconds to wait at most for all the threads to terminate on exit
+"""
+SHUTDOWN_TIMEOUT_S = 5
+
+""" CAN configuration file. It is watched while running: when it changes it is
+reloaded without restarting, see reload_can_configuration()
+"""
+CAN_CONF_FILE = "can.json"
+
 """ All global objects used for the program
 """
 can_parser = None
@@ -37,37 +56,112 @@ gps_poll = None
 vi_wdg = None
 event_manager = None
 bt_cache = None
-requested_ids = []
+frame_router = None
+filter_configurator = None
+
+""" Stores in the BT cache what was learnt about the connected VI, so that
+the next connection to the same VI can reuse it. Firmware version and device
+id are requested to the VI only if they are not cached yet. Only what the VI
+answers is cached, so a value it did not report, e.g. because the command
+timed out, is requested again at the next connection. Returns False if the
+payload format is not known yet and the function has to be called again
+"""
+def cache_vi_info(vi):
+  if vi.format is None:
+    return False
+
+  if vi.format != bt_cache.get_payload_format():
+    bt_cache.set_payload_format(vi.format)
+
+  version, device_id = bt_cache.get_vi_info()
+  if version is None or device_id is None:
+    if version is None:
+      version = vi.version()
+    if device_id is None:
+      device_id = vi.device_id()
+    bt_cache.set_vi_info(version, device_id)
+
+  event_manager.new_log_event("info" \
+    , "VI firmware: %s, device id: %s" % (version, device_id) \
+    , fired_by="Main")
+  return True
 
-""" This callback is used by the OpenXC dongle when a new frame arrives
+""" Routes the frames of the configured CAN IDs to the CAN parser and the OBD
+ones to the OBD parser. An ID configured for CAN goes to the CAN parser only,
+even if it is an OBD one
 """
-def can_frame_received(frame, **kwargs):
-  if 'id' in frame:
-    if frame['id'] in requested_ids:
-      can_parser.enqueue(frame)
-    elif frame['id'] in OBDParser.obd_ids:
-      obd_parser.enqueue(frame)
+def set_frame_routes():
+  can_ids = frozenset(can_parser.get_requested_ids())
+  frame_router.set_routes(can_ids, can_parser)
+  frame_router.set_routes([can_id for can_id in OBDParser.obd_ids \
+    if can_id not in can_ids], obd_parser)
+
+""" Called by the ConfigWatcher when the CAN configuration file changes. If
+the new configuration is valid, the parser starts using it, the frames of the
+new messages are routed to the parser and their filters are set on the VI.
+Otherwise the running configuration is kept.
+"""
+def reload_can_configuration(conf_file):
+  if not can_parser.reload_configuration(conf_file):
+    event_manager.new_log_event("warning" \
+      , "Invalid CAN configuration in %s, not reloaded" % conf_file \
+      , fired_by="Main")
+    return
+
+  set_frame_routes()
+  filter_configurator.set_messages(can_parser.get_configured_messages())
+  event_manager.new_log_event("info" \
+    , "CAN configuration reloaded from %s" % conf_file \
+    , fired_by="Main")
 
 """
 MAIN
 """
 if __name__ == '__main__':
 
-  event_manager = EventManager()
+  # With many configured messages the parsing can be spread over several
+  # threads or, to use all the CPU cores, processes. The worker processes are
+  # forked, so the pool must be built before any thread is started: the
+  # EventManager is referenced only when the callback is called. It replaces
+  # the CANParser below
+  #can_parser = CANParserPool( \
+  #  callback=lambda event: event_manager.new_can_event(event) \
+  #  ,conf_file=CAN_CONF_FILE, workers=4, multiprocess=True)
+
+  # Every consumer gets its own inbox and thread, so that a slow one (e.g.
+  # printing, or pushing over the network as REST and MQTT do) only delays
+  # itself, and its lag is reported by get_consumer_stats()
+  event_manager = EventManager(isolate_consumers=True)
   gps_poll = GPSPoll(location_update_callback=event_manager.new_gps_event)
   obd_parser = OBDParser(callback=event_manager.new_obd_event)
-  can_parser = CANParser(callback=event_manager.new_can_event)
+  can_parser = CANParser(callback=event_manager.new_can_event \
+    ,conf_file=CAN_CONF_FILE)
+
+  # Frames received from the VI are dispatched to the parsers through the
+  # frame router, which is used directly as the VI batch callback
+  frame_router = FrameRouter()
+  set_frame_routes()
 
-  requested_ids = can_parser.get_requested_ids()
+  event_manager.watch_router(frame_router)
+  event_manager.watch_queues(obd_parser.get_queues())
+  event_manager.watch_queues(can_parser.get_queues())
 
   filter_configurator = FilterConfigurator(event_manager,can_parser.get_configured_messages())
   can_writer = CANWriter(event_manager)
   vi_wdg = VIWatchdog()
+  config_watcher = ConfigWatcher(CAN_CONF_FILE, reload_can_configuration)
 
   bt_cache = BTCache()
 
   event_manager.set_timesource(SYSTimesource())
 
+  # Uncomment to measure the latency of the events from the reception of the
+  # CAN frames to the consumers, reported by "pipeline_stats" SYS events
+  #latency_monitor = LatencyMonitor()
+  #can_parser.set_latency_monitor(latency_monitor)
+  #obd_parser.set_latency_monitor(latency_monitor)
+  #event_manager.set_latency_monitor(latency_monitor)
+
   # All event consumers
   event_manager.register_consumer(filter_configurator)
   event_manager.register_consumer(vi_wdg)
@@ -85,65 +179,97 @@ if __name__ == '__main__':
   #event_manager.register_consumer(WSConsumer(event_manager \
   #  ,NullParser(),"localhost",8001))
 
-  while True:
-    event_manager.new_log_event("info", "Connecting to VI..." \
-          , fired_by="Main")
-
-    vi = None;
-
-    try:
-      vi = BluetoothVehicleInterface(address=bt_cache.get_address() \
-        ,callback=can_frame_received \
-        ,payload_format='json')
-      vi.start() # This will block until VI is connected
-      event_manager.new_vi_connect_event(vi)
-      if not bt_cache.set_address(vi.address):
-        event_manager.new_log_event("warning" \
-          ,"Cannot cache bluetooth address. Please check cache file path!" \
-          , fired_by="BTCache");
-
-      # This inner cycle is meant to periodically check the status of the VI
-      # independently from the OpenXC library.
-      # It happened sometimes that even if the connection was interrupted the 
-      # vi.join() didn't return; using vi.join(5) we block the VI thread for 
-      # 5 seconds and then check if everything was ok.
-      while True:
-        vi.join(5)
-        #event_manager.new_gps_event({ "longitude":2.073287, "latitude":48.800045, "altitude":8.2})
-        #time.sleep(2)
-        #event_manager.new_gps_event({ "longitude":2.094528, "latitude":48.809006, "altitude":138.0})
-        if not vi_wdg.vi_ok() or not vi.is_alive():
-          break
-    except Exception as e:
-      #pdb.set_trace() # TODO: let this became an event
-      event_manager.new_vi_error_event(e,fired_by="Main")
-
-    try:
-      vi.stop()
-    except Exception as e:
-      event_manager.new_vi_error_event(e,fired_by="Main")
-
-    try:
-      # The vi.disconnect() method was not present in the original OpenXC
-      # library. It was added because sometimes, after an error, the BT
-      # connection remained on, so this software wasn't able to connect
-      # anymore. vi.disconnect() closes the BT socket causing an
-      # effective disconnection
-      vi.disconnect()
-    except Exception as e:
-      event_manager.new_vi_error_event(e,fired_by="Main")
+  # The shutdown runs however the main loop is left, e.g. by a CTRL+C while
+  # connecting or waiting to reconnect, which is not caught by the loop
+  running = True
+  try:
+    while running:
+      event_manager.new_log_event("info", "Connecting to VI..." \
+            , fired_by="Main")
+
+      vi = None;
+
+      try:
+        cached_address = bt_cache.get_address()
+        vi = BluetoothVehicleInterface(address=cached_address \
+          ,batch_callback=frame_router.route \
+          ,payload_format=VI_PAYLOAD_FORMAT \
+          ,raw_can_payloads=True)
+        # The cached payload format is used only if no format is configured and
+        # the VI found is the cached one: the scan may have found another VI
+        if vi.format is None and vi.address == cached_address:
+          vi.format = bt_cache.get_payload_format()
+        vi.start() # This will block until VI is connected
+        event_manager.new_vi_connect_event(vi)
+        if not bt_cache.set_address(vi.address):
+          event_manager.new_log_event("warning" \
+            ,"Cannot cache bluetooth address. Please check cache file path!" \
+            , fired_by="BTCache");
+        vi_info_cached = cache_vi_info(vi)
+
+        # This inner cycle is meant to periodically check the status of the VI
+        # independently from the OpenXC library.
+        # It happened sometimes that even if the connection was interrupted the 
+        # vi.join() didn't return; using vi.join(5) we block the VI thread for 
+        # 5 seconds and then check if everything was ok.
+        while True:
+          vi.join(5)
+          #event_manager.new_gps_event({ "longitude":2.073287, "latitude":48.800045, "altitude":8.2})
+          #time.sleep(2)
+          #event_manager.new_gps_event({ "longitude":2.094528, "latitude":48.809006, "altitude":138.0})
+          if not vi_wdg.vi_ok() or not vi.is_alive():
+            break
+          if not vi_info_cached:
+            vi_info_cached = cache_vi_info(vi)
+      except KeyboardInterrupt:
+        # CTRL+C: disconnect from the VI as usual and then quit
+        running = False
+      except Exception as e:
+        #pdb.set_trace() # TODO: let this became an event
+        event_manager.new_vi_error_event(e,fired_by="Main")
+        # The VI may have been reflashed or replaced: ask again next time
+        bt_cache.clear_vi_info()
+
+      try:
+        vi.stop()
+      except Exception as e:
+        event_manager.new_vi_error_event(e,fired_by="Main")
+
+      try:
+        # The vi.disconnect() method was not present in the original OpenXC
+        # library. It was added because sometimes, after an error, the BT
+        # connection remained on, so this software wasn't able to connect
+        # anymore. vi.disconnect() closes the BT socket causing an
+        # effective disconnection
+        vi.disconnect()
+      except Exception as e:
+        event_manager.new_vi_error_event(e,fired_by="Main")
       
-    event_manager.new_vi_disconnect_event()
-    del vi
-    time.sleep(1)
-
-  # Cleanup stuff at the end of the program
-  filter_configurator.stop()
-  gps_poll.stop()
-  obd_parser.stop()
-  can_parser.stop()
-  can_writer.stop()
-  event_manager.stop()
+      event_manager.new_vi_disconnect_event()
+      del vi
+      if running:
+        time.sleep(1)
+  except KeyboardInterrupt:
+    pass
+  finally:
+    # Cleanup stuff at the end of the program. Every thread is woken up by its
+    # stop() method, so the teardown does not wait for any polling timeout.
+    shutdown_start = time.time()
+    consumers = event_manager.get_consumers() + event_manager.get_workers()
+    config_watcher.stop()
+    filter_configurator.stop()
+    gps_poll.stop()
+    obd_parser.stop()
+    can_parser.stop()
+    can_writer.stop()
+    event_manager.stop()
+    # gps_poll is not joined: it only notices the stop when gpsd sends data
+    alive = join_all([config_watcher, obd_parser, can_parser, event_manager] \
+      + [c for c in consumers if isinstance(c, threading.Thread)] \
+      , SHUTDOWN_TIMEOUT_S)
+    print "Shutdown took %.3f s" % (time.time() - shutdown_start)
+    for thread in alive:
+      print "Still running after shutdown: " + str(thread)
 
       
       
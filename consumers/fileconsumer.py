@@ -79,24 +79,55 @@ class JSONFileConsumer(ThreadedConsumer):
 						self._file.close()
 						self._file = None
 			else:
-				if self._file != None and not self._file.closed:
-					self._file.seek(-2,2)
-					self._file.write(",\n\t"+json.dumps(event, \
-						default=self._skip_unserializable)+"\n]")
-					self._file.flush()
+				self._write_events([event])
+
+		except IOError:
+			#TODO: Add log
+			if self._file != None and not self._file.closed:
+				self._file.close()
+				self._file = None
+
+	"""
+	All the events of a batch between two VI connection events are written
+	with a single write and flush. VI connection events are handled by
+	_consume() as usual.
+	"""
+	def _consume_batch(self, events):
+		pending = []
+		try:
+			for event in events:
+				if event['type'] == 'VI' and event['name'] == 'connection':
+					self._write_events(pending)
+					pending = []
+					self._consume(event)
+				else:
+					pending.append(event)
+			self._write_events(pending)
 
 		except IOError:
 			#TODO: Add log
 			if self._file != None and not self._file.closed:
 				self._file.close()
 				self._file = None
+
+	"""
+	Appends the events to the JSON array, if the file is open
+	"""
+	def _write_events(self, events):
+		if len(events) > 0 and self._file != None and not self._file.closed:
+			self._file.seek(-2,2)
+			self._file.write("".join([",\n\t"+json.dumps(event, \
+				default=self._skip_unserializable) for event in events])+"\n]")
+			self._file.flush()
 		
 	"""
 	This method is required in order to avoid exception when the json.dumps()
 	method tries to write down an event containing a python object, e.g. the 
 	vi object reference you get on VI connected event or any Exception you
-	get on VI error events.
+	get on VI error events. Events themselves are written as dictionaries.
 	See https://docs.python.org/2/library/json.html
 	"""
 	def _skip_unserializable(self,obj):
+		if hasattr(obj, 'to_dict'):
+			return obj.to_dict()
 		return str(obj)
@@ -88,7 +88,20 @@ class MQTTConsumer(ThreadedConsumer):
 	- Publishing all saved messages on the topic as soon as the VIN is received
 	- Keep publishing all other session events
 	"""
- 	def _consume(self, event):
+	def _consume(self, event):
+		self._add_to_backlog(event)
+		self._publish_backlog()
+
+	"""
+	All the events of a batch are added to the backlog, which is then
+	published once
+	"""
+	def _consume_batch(self, events):
+		for event in events:
+			self._add_to_backlog(event)
+		self._publish_backlog()
+
+	def _add_to_backlog(self, event):
  		if event['type'] == "OBD" and event['name'] == 'VIN':
  			# When VIN is received we have the complete MQTT topic
  			self.topic_suffix = event['value']
@@ -98,6 +111,7 @@ class MQTTConsumer(ThreadedConsumer):
  			# the client is connected to the MQTT broker
  			self._backlog.append(event)
 
+	def _publish_backlog(self):
  		if self.topic_suffix is not None and self._mqtt_connected:
  			# Everything looks ok to publish the data. Just go through the
  			# backlog and publish everything in it.
@@ -25,6 +25,9 @@ class RESTConsumer(ThreadedConsumer):
 	URL = "https://api.myjson.com/bins/t4ppn"
 	REQUEST_INTERVAL_S = 5
 
+	# Subscription to the EventManager
+	EVENT_TYPES = ('CAN','OBD')
+
 	def __init__(self, event_manager, url=URL,req_intvl_s=REQUEST_INTERVAL_S):
 		ThreadedConsumer.__init__(self)
 		self._event_manager = event_manager
@@ -35,15 +38,37 @@ class RESTConsumer(ThreadedConsumer):
 		self._last_req_ts = 0
 		self._pt = PeriodicTimer(req_intvl_s,self._rest_req)
 		self._pt.run() 
- 	"""
- 	"""
- 	def _consume(self, event):
+	"""
+	Only the last data are sent anyway, so every event just updates them
+	"""
+	def _consume(self, event):
+		self._store(event)
+
+	"""
+	Same as ThreadedConsumer._consume_batch(): an event that cannot be stored
+	does not prevent the others in the batch from being stored
+	"""
+	def _consume_batch(self, events):
+		for event in events:
+			try:
+				self._store(event)
+			except Exception as e:
+				print "ThreadedConsumer: Exception in ThreadedConsumer or subclasses: "+str(e)
+
+	def _store(self, event):
 		if event['type'] == 'CAN' or event['type'] == 'OBD':
 			self._last_data[event['name']] = str(event['value'])
 			self._last_data['time'] = event['time']
 			self._last_data['lastUpd'] = str(int(time.time()))
 			self._last_event_ts = time.time()
 
+	"""
+	Stops the periodic requests too
+	"""
+	def stop(self):
+		self._pt.stop()
+		ThreadedConsumer.stop(self)
+
 	def _rest_req(self,args):
 		if self._last_event_ts > self._last_req_ts:
 			self._last_req_ts = time.time()
@@ -5,8 +5,11 @@ This module exports an abstract threaded implementation of an event consumer
 __author__ = "Dario Fiumicello"
 __email__ = "dario.fiumicello@gmail.com"
 
-import Queue
+from eventmanager import ConsumerStats
+from utils import BoundedQueue
+from utils.boundedqueue import event_key
 import threading
+import time
 
 import pdb
 
@@ -22,40 +25,96 @@ class ThreadedConsumer(threading.Thread):
 	consumers, avoiding starvation.
 
 	See EventManager.
+
+	The queue holds at most QUEUE_SIZE events, so that a consumer stuck on a
+	slow network does not eat up all the memory. When it is full, an event
+	replaces the waiting one with the same type and name, if any, otherwise
+	the oldest event is dropped. Subclasses can override QUEUE_SIZE and
+	QUEUE_POLICY, or they can be passed to the constructor. See BoundedQueue.
+
+	Events are queued along with the time they were queued at, so that the
+	consumer measures its own statistics in "stats", as a ConsumerWorker
+	does: the latency of _consume_batch() and the lag of the oldest event of
+	every batch. The EventManager reports them, see
+	EventManager.get_consumer_stats().
 	"""
 
-	def __init__(self):
+	QUEUE_SIZE = 10000
+	QUEUE_POLICY = BoundedQueue.COALESCE
+	# Maximum number of queued events passed at once to _consume_batch()
+	BATCH_SIZE = 64
+
+	def __init__(self, queue_size=None, queue_policy=None):
 		threading.Thread.__init__(self)
 		self.daemon = True
 		self._can_run = True
-		self._q = Queue.Queue() 
+		self._latency_monitor = None
+		self.stats = ConsumerStats(self.__class__.__name__)
+		if queue_size is None:
+			queue_size = self.QUEUE_SIZE
+		self._q = BoundedQueue(queue_size \
+			,queue_policy or self.QUEUE_POLICY \
+			,name=self.__class__.__name__ \
+			,key=lambda item: event_key(item[1]))
 		self.start()
 
+	"""
+	Returns the list of the queues of this consumer, so that their drops can
+	be watched. See EventManager.watch_queues()
+	"""
+	def get_queues(self):
+		return [self._q]
+
+	"""
+	Sets the LatencyMonitor that gets the events once they are consumed. It
+	is called by the event manager, see EventManager.set_latency_monitor()
+	"""
+	def set_latency_monitor(self,monitor):
+		self._latency_monitor = monitor
+
 	"""
 	This is the consume() method called by the event manager. Its only
 	purpose is to put the event into a local FIFO queue, so it is really
 	fast. The event is then processed asynchronously.
 	"""
 	def consume(self,event):
-		self._q.put(event)
+		self._q.put((time.time(), event))
+
+	"""
+	Same as consume() for a list of events, which are queued at once. It is
+	called by the event manager when it dispatches events in batches.
+	"""
+	def consume_batch(self,events):
+		now = time.time()
+		self._q.put_many([(now, event) for event in events])
 
 	"""
-	The main thread will simply block over the queue waiting for a new event
-	to arrive. As soon as the queue is not empty anymore the event will be
-	passed to the _consume() method, which has to be extended by subclasses
-	and can be used to perform time-consuming jobs.
+	The main thread will simply block over the queue waiting for new events
+	to arrive. As soon as the queue is not empty anymore all the queued
+	events, up to BATCH_SIZE, will be passed to the _consume_batch() method.
+	By default it passes them one by one to the _consume() method, which has
+	to be extended by subclasses and can be used to perform time-consuming
+	jobs.
+	A None is put on the queue by stop() to wake the thread up.
 	"""
 	def run(self):
+		stats = self.stats
 		while self._can_run:
 			try:
-  				event = self._q.get(True,5)
-				if event is not None:
-					self._consume(event)
-
-			except Queue.Empty:
-				pass
+				items = self._q.get_batch(self.BATCH_SIZE)
+				items = [item for item in items if item is not None]
+				if len(items) > 0:
+					events = [item[1] for item in items]
+					start = time.time()
+					self._consume_batch(events)
+					stats.record(time.time() - start, start - items[0][0] \
+						,count=len(events))
+					monitor = self._latency_monitor
+					if monitor is not None:
+						monitor.consumed(events)
 
 			except Exception as e:
+				stats.errors += 1
 				print "ThreadedConsumer: Exception in ThreadedConsumer or subclasses: "+str(e)
 
 			finally:
@@ -66,6 +125,7 @@ class ThreadedConsumer(threading.Thread):
 	"""
 	def stop(self):
 		self._can_run = False
+		self._q.wake()
 
 	"""
 	This method has to be implemented by inheriting consumers. Inside this
@@ -73,3 +133,14 @@ class ThreadedConsumer(threading.Thread):
 	"""
 	def _consume(self,event):
 		raise NotImplemented("This method is intended to be implemented by subclasses")
+
+	"""
+	This method can be overridden by consumers that can process many events
+	at once more efficiently, e.g. with a single write or network request.
+	"""
+	def _consume_batch(self,events):
+		for event in events:
+			try:
+				self._consume(event)
+			except Exception as e:
+				print "ThreadedConsumer: Exception in ThreadedConsumer or subclasses: "+str(e)
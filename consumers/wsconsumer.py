@@ -107,7 +107,17 @@ class WSConsumer(ThreadedConsumer):
 
  	def _consume(self, event):
 		self._backlog.append(event)
+		self._send_backlog()
 
+	"""
+	All the events of a batch are added to the backlog, which is then sent
+	once, looking up the WebSocket connection only once
+	"""
+	def _consume_batch(self, events):
+		self._backlog.extend(events)
+		self._send_backlog()
+
+	def _send_backlog(self):
 		proto = get_protocol(self._addr, self._port)
 
 		if proto is not None:
@@ -1 +1,3 @@
 from .eventmanager import EventManager
+from .consumerworker import ConsumerWorker, ConsumerStats
+from .event import Event
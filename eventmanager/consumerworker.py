@@ -0,0 +1,134 @@
+"""
+This module provides the classes used by the EventManager to isolate the
+consumers from each other and to measure how they keep up with the events
+"""
+
+__author__ = "Dario Fiumicello"
+__email__ = "dario.fiumicello@gmail.com"
+
+from utils import BoundedQueue
+from utils.boundedqueue import event_key
+import threading
+import time
+
+class ConsumerStats():
+	"""
+	Statistics about the delivery of events to a consumer:
+	- "events" and "errors" count the delivered events and the exceptions
+	  raised by the consumer while consuming them.
+	- the latency is the time spent in the consume() or consume_batch()
+	  methods of the consumer. The mean is per event, the max per call.
+	- the lag is the time an event waited in the inbox of the consumer
+	  before being consumed. It is only measured for consumers with an
+	  inbox, see ConsumerWorker and ThreadedConsumer.
+	Times are in seconds.
+	"""
+	def __init__(self,name):
+		self.name = name
+		self.events = 0
+		self.errors = 0
+		self.total_latency = 0.0
+		self.max_latency = 0.0
+		self.last_lag = None
+		self.max_lag = 0.0
+
+	def record(self,latency,lag=None,count=1):
+		self.events += count
+		self.total_latency += latency
+		if latency > self.max_latency:
+			self.max_latency = latency
+		if lag is not None:
+			self.last_lag = lag
+			if lag > self.max_lag:
+				self.max_lag = lag
+
+	"""
+	Returns the statistics as a dictionary, with times in milliseconds
+	"""
+	def to_dict(self):
+		stats = {
+			'consumer' : self.name,
+			'events' : self.events,
+			'errors' : self.errors,
+			'mean_latency_ms' : \
+				1000 * self.total_latency / self.events if self.events else 0.0,
+			'max_latency_ms' : 1000 * self.max_latency
+		}
+		if self.last_lag is not None:
+			stats['last_lag_ms'] = 1000 * self.last_lag
+			stats['max_lag_ms'] = 1000 * self.max_lag
+		return stats
+
+
+class ConsumerWorker(threading.Thread):
+	"""
+	A ConsumerWorker gives a consumer its own bounded inbox and thread, the
+	way ThreadedConsumer does, without the consumer being aware of it. The
+	EventManager wraps the consumers in workers when it runs in isolated
+	mode, so that a slow or failing consumer cannot delay the others.
+
+	An exception raised by the consumer is counted and printed, and the
+	worker goes on with the next event.
+	"""
+
+	QUEUE_SIZE = 1000
+	QUEUE_POLICY = BoundedQueue.COALESCE
+
+	def __init__(self,consumer,queue_size=None,queue_policy=None):
+		threading.Thread.__init__(self)
+		self.daemon = True
+		self._can_run = True
+		self._consumer = consumer
+		self._latency_monitor = None
+		self.stats = ConsumerStats(consumer.__class__.__name__)
+		if queue_size is None:
+			queue_size = self.QUEUE_SIZE
+		# Events are queued together with the time they were queued at, in
+		# order to measure the lag
+		self._q = BoundedQueue(queue_size \
+			,queue_policy or self.QUEUE_POLICY \
+			,name=self.stats.name \
+			,key=lambda item: event_key(item[1]))
+		self.start()
+
+	def consume(self,event):
+		self._q.put((time.time(), event))
+
+	def consume_batch(self,events):
+		now = time.time()
+		self._q.put_many([(now, event) for event in events])
+
+	def get_queues(self):
+		return [self._q]
+
+	"""
+	Sets the LatencyMonitor that gets the events once they are consumed
+	"""
+	def set_latency_monitor(self,monitor):
+		self._latency_monitor = monitor
+
+	def run(self):
+		stats = self.stats
+		while self._can_run:
+			item = self._q.get()
+			if item is None:
+				continue
+
+			start = time.time()
+			try:
+				self._consumer.consume(item[1])
+			except Exception as e:
+				stats.errors += 1
+				# TODO: Good log please
+				print "Exception in consumer "+stats.name+": "+str(e)
+			stats.record(time.time() - start, start - item[0])
+			monitor = self._latency_monitor
+			if monitor is not None:
+				monitor.consumed((item[1],))
+
+	"""
+	Stops the worker thread. The consumer itself is not stopped.
+	"""
+	def stop(self):
+		self._can_run = False
+		self._q.wake()
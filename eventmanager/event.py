@@ -0,0 +1,147 @@
+"""
+This module provides the Event class
+"""
+
+__author__ = "Dario Fiumicello"
+__email__ = "dario.fiumicello@gmail.com"
+
+class Event(object):
+	"""
+	An Event is a compact replacement for the dictionaries that used to
+	represent events: it has no per-instance dictionary and the time is
+	kept as a float timestamp, formatted as an ISO 8601 string only when
+	someone reads it.
+
+	The fields are:
+	- "type", "name" and "value", see EventManager
+	- "timestamp", the time of the event in seconds since the epoch
+	- "time", the ISO 8601 representation of the timestamp, or the string
+	  given by a time source that only provides formatted times
+	- "extras", a dictionary with any other key (e.g. "vi", "fired_by" or the
+	  GPS coordinates), None if there are none
+	- "trace", the list of the timestamps of the event through the pipeline
+	  when it is measured, None otherwise. See LatencyMonitor
+
+	For the existing consumers and outlet parsers an Event also behaves like
+	the old dictionary: event['name'], 'id' in event, event.get('data'),
+	keys(), iteration and so on. A field set to None is not listed by keys()
+	nor found by "in", as a missing key was, but reading it gives None (e.g.
+	the value of a raw value without a state): only the keys that are
+	neither fields nor extras raise KeyError. to_dict() returns the
+	equivalent dictionary, e.g. for JSON serialization.
+	"""
+
+	__slots__ = ('type', 'name', 'value', 'timestamp', 'extras', 'trace' \
+		,'_time', '_format_time')
+
+	FIELDS = ('type', 'name', 'value', 'time')
+
+	def __init__(self,event_type=None,name=None,value=None,extras=None):
+		self.type = event_type
+		self.name = name
+		self.value = value
+		self.extras = extras
+		self.timestamp = None
+		self.trace = None
+		self._time = None
+		self._format_time = None
+
+	"""
+	Builds an Event from an old style event dictionary, which is not
+	modified
+	"""
+	@classmethod
+	def from_dict(cls,event_dict):
+		extras = dict(event_dict)
+		event = cls(extras.pop('type', None) \
+			,extras.pop('name', None) \
+			,extras.pop('value', None))
+		event._time = extras.pop('time', None)
+		if len(extras) > 0:
+			event.extras = extras
+		return event
+
+	"""
+	Sets the timestamp of the event. format_time(timestamp) is called to
+	build the "time" string the first time it is read. A None timestamp,
+	e.g. from a GPS without a fix, gives no time.
+	"""
+	def set_timestamp(self,timestamp,format_time):
+		self.timestamp = timestamp
+		self._format_time = format_time
+		self._time = None
+
+	@property
+	def time(self):
+		if self._time is None and self._format_time is not None \
+			and self.timestamp is not None:
+			self._time = self._format_time(self.timestamp)
+		return self._time
+
+	@time.setter
+	def time(self,value):
+		self._time = value
+		self._format_time = None
+
+	# The time is formatted before pickling, e.g. to send the event to
+	# another process, since the format function may not be picklable
+	def __getstate__(self):
+		return (self.type, self.name, self.value, self.timestamp \
+			,self.extras, self.time)
+
+	def __setstate__(self,state):
+		self.type, self.name, self.value, self.timestamp \
+			,self.extras, self._time = state
+		self.trace = None
+		self._format_time = None
+
+	def __getitem__(self,key):
+		# Spelled out, since this is the hot path of the old consumers
+		if key == 'name':
+			return self.name
+		elif key == 'value':
+			return self.value
+		elif key == 'type':
+			return self.type
+		elif key == 'time':
+			return self.time
+		elif self.extras is None:
+			raise KeyError(key)
+		return self.extras[key]
+
+	def __setitem__(self,key,value):
+		if key in Event.FIELDS:
+			setattr(self, key, value)
+		else:
+			if self.extras is None:
+				self.extras = {}
+			self.extras[key] = value
+
+	def __contains__(self,key):
+		if key in Event.FIELDS:
+			return getattr(self, key) is not None
+		return self.extras is not None and key in self.extras
+
+	def __iter__(self):
+		return iter(self.keys())
+
+	def get(self,key,default=None):
+		try:
+			return self[key]
+		except KeyError:
+			return default
+
+	def keys(self):
+		keys = [key for key in Event.FIELDS if getattr(self, key) is not None]
+		if self.extras is not None:
+			keys.extend(self.extras)
+		return keys
+
+	def items(self):
+		return [(key, self[key]) for key in self.keys()]
+
+	def to_dict(self):
+		return dict(self.items())
+
+	def __repr__(self):
+		return repr(self.to_dict())
@@ -5,13 +5,14 @@ This module provides the EventManager class
 __author__ = "Dario Fiumicello"
 __email__ = "dario.fiumicello@gmail.com"
 
-import Queue
+from .consumerworker import ConsumerWorker, ConsumerStats
+from .event import Event
+from utils import BoundedQueue, PeriodicTimer
 import threading
+import time
 import weakref
 from datetime import datetime
 
-import pdb
-
 class EventManager(threading.Thread):
 	"""
 	EventManager purpose is to collect every kind of event that happens
@@ -30,28 +31,114 @@ class EventManager(threading.Thread):
 		- OBD: Events related to OBD, like the reception of an OBD message
 		- CAN: Events related to the reception of CAN signals from the VI
 		- GPS: Used for position updates coming from the GPS shield
+		- SYS: Events related to the system running this software
 	- "name" is strictly related to the event type and it is usually set by
 	  the event producer.
 	- "time" is an ISO 8601 date that is added by the event manager as
 	  soon as someone produces an event. The timestamp is taken by a
 	  class called "TimeSource" that is registered after the EventManager and
-	  provides a "get_time()" method
+	  provides a "get_time()" method. If the TimeSource also provides the
+	  "get_timestamp()" and "format_time(timestamp)" methods, only the
+	  timestamp is taken and the date is formatted when first needed.
+
+	Events are Event objects, which still behave like the dictionaries used
+	before. Producers can pass either an Event or a dictionary.
+
+	The inlet queue holds at most QUEUE_SIZE events, with the QUEUE_POLICY
+	applied when it is full (see BoundedQueue). The EventManager also
+	watches the queues of the registered consumers, and of anything passed
+	to watch_queues(): every QUEUE_REPORT_PERIOD seconds a "queue_drops" LOG
+	event is fired for each queue that dropped events since the last report,
+	its value being { "queue", "dropped", "total" }. The frames of a
+	FrameRouter passed to watch_router() that had no route are reported in
+	the same way, "queue" being "FrameRouter" and the value also having the
+	"ids" dictionary with the count of unrouted frames per hex CAN ID.
+
+	Consumers are registered with a subscription: a set of event types, a
+	set of event names and a predicate, any of them being None when it does
+	not matter. The sets default to the EVENT_TYPES and EVENT_NAMES
+	attributes of the consumer, if it has them. The consumers wanting a given
+	(type, name) pair are looked up once and then kept in an index, so every
+	event is only forwarded to the consumers subscribed to it.
+
+	In isolated mode every consumer without its own queue (i.e. not a
+	ThreadedConsumer) is wrapped in a ConsumerWorker, with a bounded inbox
+	and a thread, so that a slow consumer only delays itself. Consumers and
+	workers with a ConsumerStats of their own, in their "stats" attribute,
+	measure it themselves, lag included. In both modes
+	an exception raised by a consumer is counted and printed, and the
+	delivery goes on. Statistics about every consumer (events, errors,
+	latency, lag and queue usage) are returned by get_consumer_stats().
+
+	The queue is drained in batches of at most BATCH_SIZE events, waiting at
+	most BATCH_WAIT_S seconds for the batch to fill up (by default only the
+	events already queued are taken). Consumers providing a
+	consume_batch(events) method get all the events of a batch they are
+	subscribed to with a single call, the others get them one by one through
+	consume(event).
+
+	The registry of the consumers is copy-on-write: registering a consumer
+	builds a new registry, so the dispatch never waits on the registration.
+
+	The latency of the events through the pipeline can be measured by a
+	LatencyMonitor, see set_latency_monitor(). Its statistics are then fired
+	every LATENCY_REPORT_PERIOD seconds as a "pipeline_stats" SYS event, its
+	value being LatencyMonitor.stats().
 
 	"""
 
+	QUEUE_SIZE = 10000
+	QUEUE_POLICY = BoundedQueue.COALESCE
+	QUEUE_REPORT_PERIOD = 10
+	ISOLATE_CONSUMERS = False
+	BATCH_SIZE = 64
+	BATCH_WAIT_S = 0
+	LATENCY_REPORT_PERIOD = 10
+
 	"""
 	Constructor simply initialize the thread and al the needed stuff.
-	Consumers are put int a set in order to avoid duplicates in case of
-	double registration
+	Consumers are the keys of a dictionary, mapping them to their
+	registration, in order to avoid duplicates in case of double registration
 	"""
-	def __init__(self):
+	def __init__(self, queue_size=None, queue_policy=None \
+		,queue_report_period=QUEUE_REPORT_PERIOD \
+		,isolate_consumers=ISOLATE_CONSUMERS \
+		,batch_size=BATCH_SIZE, batch_wait_s=BATCH_WAIT_S):
 		threading.Thread.__init__(self)
 		self.daemon = True
 		self._can_run = True
-		self._q = Queue.Queue()
-		self._consumers = set()
+		if queue_size is None:
+			queue_size = self.QUEUE_SIZE
+		self._q = BoundedQueue(queue_size \
+			,queue_policy or self.QUEUE_POLICY \
+			,name=self.__class__.__name__)
+		self._isolate_consumers = isolate_consumers
+		self._batch_size = batch_size
+		self._batch_wait_s = batch_wait_s
+		# The registry is a (consumers, index) tuple, replaced as a whole on
+		# every change. "consumers" maps every consumer to a (types, names,
+		# predicate, target, stats) tuple, where target is the consumer
+		# itself or its ConsumerWorker. "index" maps a (type, name) pair to
+		# a tuple of (target, predicate, stats, measured, batching, monitor)
+		# for the subscribed consumers, measured telling if the EventManager
+		# has to record the latency in stats (errors are always counted
+		# there), batching telling if the target has consume_batch() and
+		# monitor being the LatencyMonitor if the EventManager has to
+		# measure it.
+		self._registry = ({}, {})
 		self._timesource = None
+		self._get_timestamp = None
+		self._format_time = None
+		self._latency_monitor = None
+		self._latency_timer = None
 		self._consumers_lock = threading.RLock()
+		# Watched queue -> number of drops at the last report
+		self._watched_queues = { self._q : 0 }
+		# Watched FrameRouter -> number of unrouted frames at the last report
+		self._watched_routers = {}
+		self._queue_timer = PeriodicTimer(queue_report_period \
+			,self._report_queue_drops)
+		self._queue_timer.run()
 		self.start()
 
 	"""
@@ -59,8 +146,38 @@ class EventManager(threading.Thread):
 	ISO 8601 date through the get_time() method
 	"""
 	def set_timesource(self,timesource):
+		# The bound methods are kept, in order not to build them per event
+		self._get_timestamp = getattr(timesource, 'get_timestamp', None)
+		self._format_time = getattr(timesource, 'format_time', None)
 		self._timesource = timesource
 
+	"""
+	Sets the LatencyMonitor measuring the latency of the events. It is passed
+	to the consumers that consume the events in their own thread (i.e. with a
+	set_latency_monitor() method, like ThreadedConsumer and ConsumerWorker),
+	the others are measured by the EventManager itself. The parsers have to
+	be given the same monitor. None stops the measurements.
+	"""
+	def set_latency_monitor(self,monitor,report_period=LATENCY_REPORT_PERIOD):
+		with self._consumers_lock:
+			if self._latency_timer is not None:
+				self._latency_timer.stop()
+				self._latency_timer = None
+
+			self._latency_monitor = monitor
+			consumers = self._registry[0]
+			for registration in consumers.values():
+				target = registration[3]
+				if hasattr(target, 'set_latency_monitor'):
+					target.set_latency_monitor(monitor)
+			self._registry = (consumers, {})
+
+			if monitor is not None:
+				monitor.watch_queues(self._watched_queues.keys())
+				self._latency_timer = PeriodicTimer(report_period \
+					,self._report_latency)
+				self._latency_timer.run()
+
 	"""
 	All the new_XXX_event() are just decorators over the private _new_event() 
 	method.
@@ -72,7 +189,7 @@ class EventManager(threading.Thread):
 		self._new_event(event,'OBD')		
 
 	def new_gps_event(self,event):
-		event.update({ 'name' : 'Position' })
+		event['name'] = 'Position'
 		self._new_event(event,'GPS')		
 
 	"""
@@ -81,61 +198,106 @@ class EventManager(threading.Thread):
 	over vi can immediatly obtain its reference.
 	"""
 	def new_vi_connect_event(self,vi):
-		self._new_event({ \
-			'name':'connection', \
-			'value':'connected', \
-			'vi':vi },'VI')
+		self._new_event(Event('VI','connection','connected' \
+			,{ 'vi':vi }),'VI')
 
 	def new_vi_disconnect_event(self):
-		self._new_event({ \
-			'name':'connection', \
-			'value':'disconnected' },'VI')
+		self._new_event(Event('VI','connection','disconnected'),'VI')
 
 	def new_log_event(self,name,value,fired_by=None):
-		self._new_event({ \
-			'name':name, \
-			'value':value, \
-			'fired_by':fired_by },'LOG')
+		self._new_event(Event('LOG',name,value \
+			,{ 'fired_by':fired_by }),'LOG')
 
 	"""
 	When an error occurs over vi it is forwarded through the VI error event.
 	Producer can also specify who it is for debug purposes
 	"""
 	def new_vi_error_event(self,exception,fired_by=None):
-		self._new_event({ \
-			'name':'error', \
-			'value':exception, \
-			'fired_by':fired_by },'VI')
+		self._new_event(Event('VI','error',exception \
+			,{ 'fired_by':fired_by }),'VI')
 
 	"""
-	This is the main thread method. Every time there is an event on the queue
-	it will be popped and forwarded to all consumers.
+	This is the main thread method. Every time there are events on the queue
+	they will be popped in a batch and forwarded to all the subscribed
+	consumers.
 	"""
 	def run(self):
 		while self._can_run:
 			try:
-				# get(True,5) blocks for 5 secs if the queue is empty.
-				# If an event is inserted during the block it will be
-				# immediatly unblocked and the event will be processed.
-  				event = self._q.get(True,5)
-				if event is not None:
-					with self._consumers_lock:
-						for consumer in self._consumers:
-							consumer.consume(event)
-
-			except Queue.Empty:
-				pass
+				# get_batch() blocks until an event is inserted, or until
+				# stop() puts a None in the queue to wake the thread up.
+  				events = self._q.get_batch(self._batch_size,self._batch_wait_s)
+				self._dispatch(events)
 
 			except Exception as e:
-				pdb.set_trace()
 				# TODO: Good log please
-				print "Exception in "+self.__name__+": "+e
-
-			finally:
-				pass
+				print "Exception in EventManager: "+str(e)
 
 		self._timesource = None
 
+	def _dispatch(self,events):
+		consumers, index = self._registry
+		monitor = self._latency_monitor
+		if monitor is not None:
+			monitor.dispatched([event for event in events if event is not None])
+
+		batches = {}
+		for event in events:
+			if event is None:
+				continue
+
+			key = (event.type, event.name)
+			targets = index.get(key)
+			if targets is None:
+				targets = self._get_targets(consumers,key)
+				index[key] = targets
+
+			for target, predicate, stats, measured, batching, monitor in targets:
+				if predicate is not None \
+						and not self._accepts(predicate,event,stats):
+					continue
+				if not batching:
+					self._deliver(target.consume,event,stats,measured)
+					if monitor is not None:
+						monitor.consumed((event,))
+				elif target in batches:
+					batches[target][3].append(event)
+				else:
+					batches[target] = (stats, measured, monitor, [event])
+
+		for target, (stats, measured, monitor, batch) in batches.items():
+			self._deliver(target.consume_batch,batch,stats,measured,len(batch))
+			if monitor is not None:
+				monitor.consumed(batch)
+
+	"""
+	Calls the consume function of a consumer, measuring its latency if
+	measured is True. A failure is counted in the errors of stats either way
+	"""
+	def _deliver(self,consume,arg,stats,measured,count=1):
+		start = time.time()
+		try:
+			consume(arg)
+		except Exception as e:
+			self._consumer_error(stats,e)
+		if measured:
+			stats.record(time.time() - start, count=count)
+
+	"""
+	Returns what the predicate of a consumer returns for the event, False if
+	the predicate fails
+	"""
+	def _accepts(self,predicate,event,stats):
+		try:
+			return predicate(event)
+		except Exception as e:
+			self._consumer_error(stats,e)
+			return False
+
+	def _consumer_error(self,stats,e):
+		stats.errors += 1
+		# TODO: Good log please
+		print "Exception in consumer "+stats.name+": "+str(e)
 
 	"""
 	If the event manager is stopped then every consumer will be stopped and 
@@ -143,40 +305,210 @@ class EventManager(threading.Thread):
 	operations before closing the program
 	"""
 	def stop(self):
+		self._queue_timer.stop()
+		if self._latency_timer is not None:
+			self._latency_timer.stop()
 		with self._consumers_lock:
-			for consumer in self._consumers:
+			consumers = self._registry[0]
+			self._registry = ({}, {})
+		for consumer, registration in consumers.items():
+			target = registration[3]
+			if target is not consumer:
+				target.stop()
+			if hasattr(consumer, 'stop'):
 				consumer.stop()
-			consumer.clear()
 		self._can_run = False
+		self._q.wake()
+
+	"""
+	Returns a tuple of the registered consumers. It can be used before
+	stop() in order to wait for the consumer threads to terminate
+	"""
+	def get_consumers(self):
+		return tuple(self._registry[0])
+
+	"""
+	Returns a tuple of the ConsumerWorkers wrapping the consumers in isolated
+	mode. Like get_consumers(), it can be used before stop()
+	"""
+	def get_workers(self):
+		return tuple(registration[3] \
+			for consumer, registration in self._registry[0].items() \
+			if registration[3] is not consumer)
+
+	"""
+	Returns a list of dictionaries with the statistics of every consumer, see
+	ConsumerStats. For the consumers with a queue the number of queued and
+	dropped events are added as "queued" and "dropped".
+	"""
+	def get_consumer_stats(self):
+		consumer_stats = []
+		for consumer, registration in self._registry[0].items():
+			target, stats = registration[3], registration[4]
+			stats = stats.to_dict()
+			if hasattr(target, 'get_queues'):
+				queues = target.get_queues()
+				stats['queued'] = sum(queue.qsize() for queue in queues)
+				stats['dropped'] = sum(queue.dropped for queue in queues)
+			consumer_stats.append(stats)
+		return consumer_stats
 
 	"""
 	For register a new consumer. 
-	Consumers classes has to provide the consume(event) method. Note that a
-	lock is used to prevent changing the consumers' set while it is being
-	iterated over on the "run()" method.
+	Consumers classes has to provide the consume(event) method. The lock
+	only serializes the changes to the registry, the "run()" method keeps
+	dispatching events with the previous registry in the meantime.
+	The consumer will only get the events whose type is in event_types, whose
+	name is in event_names and for which predicate(event) returns True. See
+	the class description for the defaults. Registering the consumer again
+	replaces its subscription.
 	"""
-	def register_consumer(self,consumer):
+	def register_consumer(self,consumer,event_types=None,event_names=None \
+		,predicate=None):
+		if event_types is None:
+			event_types = getattr(consumer, 'EVENT_TYPES', None)
+		if event_names is None:
+			event_names = getattr(consumer, 'EVENT_NAMES', None)
+		if event_types is not None:
+			event_types = frozenset(event_types)
+		if event_names is not None:
+			event_names = frozenset(event_names)
+
 		with self._consumers_lock:
-			self._consumers.add(consumer)
+			consumers = dict(self._registry[0])
+			registration = consumers.get(consumer)
+			if registration is not None:
+				target, stats = registration[3], registration[4]
+			elif self._isolate_consumers \
+				and not hasattr(consumer, 'get_queues'):
+				target = ConsumerWorker(consumer)
+				stats = target.stats
+			else:
+				target = consumer
+				stats = getattr(consumer, 'stats', None)
+				if not isinstance(stats, ConsumerStats):
+					stats = ConsumerStats(consumer.__class__.__name__)
+
+			consumers[consumer] = \
+				(event_types, event_names, predicate, target, stats)
+			self._registry = (consumers, {})
+			if hasattr(target, 'get_queues'):
+				self.watch_queues(target.get_queues())
+			if self._latency_monitor is not None \
+				and hasattr(target, 'set_latency_monitor'):
+				target.set_latency_monitor(self._latency_monitor)
 
 	"""
-	For unregister a consumer.
-	A lock is used to prevent the same situation of "register_consumer()"
-	method
+	For unregister a consumer. Its worker, if any, is stopped.
 	"""
 	def unregister_consumer(self,consumer):
 		with self._consumers_lock:
-			self._consumers.discard(consumer)
+			consumers = dict(self._registry[0])
+			registration = consumers.pop(consumer, None)
+			self._registry = (consumers, {})
+			if registration is None:
+				return
+
+			target = registration[3]
+			if hasattr(target, 'get_queues'):
+				for queue in target.get_queues():
+					self._watched_queues.pop(queue, None)
+		if target is not consumer:
+			target.stop()
+
+	"""
+	Returns the targets subscribed to the events with the given (type, name)
+	key, along with their predicates and stats, and the LatencyMonitor if
+	the EventManager has to measure them. See __init__()
+	"""
+	def _get_targets(self,consumers,key):
+		event_type, event_name = key
+		monitor = self._latency_monitor
+		return tuple((target, predicate, stats \
+				,getattr(target, 'stats', None) is not stats \
+				,hasattr(target, 'consume_batch') \
+				,monitor if not hasattr(target, 'set_latency_monitor') else None) \
+			for consumer, (types, names, predicate, target, stats) \
+			in consumers.items() \
+			if (types is None or event_type in types) \
+			and (names is None or event_name in names))
+
+	"""
+	Adds the given BoundedQueues (e.g. the ones returned by the get_queues()
+	method of a parser) to the queues whose drops are reported
+	"""
+	def watch_queues(self,queues):
+		with self._consumers_lock:
+			for queue in queues:
+				self._watched_queues.setdefault(queue, queue.dropped)
+			if self._latency_monitor is not None:
+				self._latency_monitor.watch_queues(queues)
+
+	"""
+	Adds a FrameRouter to the ones whose unrouted frames are reported
+	"""
+	def watch_router(self,router):
+		with self._consumers_lock:
+			self._watched_routers.setdefault(router, router.unrouted_frames)
+
+	"""
+	Fires a "queue_drops" LOG event for every watched queue that dropped
+	events, and for every watched FrameRouter that did not route frames,
+	since the last report
+	"""
+	def _report_queue_drops(self,args):
+		with self._consumers_lock:
+			watched = self._watched_queues.items()
+			routers = self._watched_routers.items()
+
+		for router, reported in routers:
+			unrouted = router.unrouted_frames
+			if unrouted > reported:
+				with self._consumers_lock:
+					self._watched_routers[router] = unrouted
+				self.new_log_event("queue_drops", { \
+					'queue':router.__class__.__name__, \
+					'dropped':unrouted - reported, \
+					'total':unrouted, \
+					'ids':dict((hex(can_id), count) for can_id, count \
+						in dict(router.unrouted_ids).items()) \
+					}, fired_by="EventManager")
+
+		for queue, reported in watched:
+			dropped = queue.dropped
+			if dropped > reported:
+				with self._consumers_lock:
+					if queue in self._watched_queues:
+						self._watched_queues[queue] = dropped
+				self.new_log_event("queue_drops", { \
+					'queue':queue.name, \
+					'dropped':dropped - reported, \
+					'total':dropped }, fired_by="EventManager")
+
+	"""
+	Fires the "pipeline_stats" SYS event with the statistics of the
+	LatencyMonitor
+	"""
+	def _report_latency(self,args):
+		monitor = self._latency_monitor
+		if monitor is not None:
+			self._new_event(Event('SYS','pipeline_stats',monitor.stats()),'SYS')
 
 	"""
 	Private method to add an already tagged new event. See the methods
 	new_XXX_event() above.
 	Every time it is called it adds the "time" tag and put the event in the
-	queue
+	queue. Dictionaries are converted to Event objects first.
 	"""
 	def _new_event(self,event,event_type):
-		event['type'] = event_type
-		if self._timesource is not None:
-			event['time'] = self._timesource.get_time()
+		if not isinstance(event, Event):
+			event = Event.from_dict(event)
+		event.type = event_type
+		timesource = self._timesource
+		if timesource is not None:
+			if self._get_timestamp is not None:
+				event.set_timestamp(self._get_timestamp(),self._format_time)
+			else:
+				event.time = timesource.get_time()
 		self._q.put(event)
 
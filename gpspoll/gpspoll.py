@@ -16,6 +16,9 @@ import time
 import threading
 import geohash
 import math
+import calendar
+import dateutil.parser
+from utils import SYSTimesource
 
 class GPSPoll(threading.Thread):
   """ The GPSPoll class is designed as an independent thread in order to 
@@ -37,6 +40,10 @@ class GPSPoll(threading.Thread):
     self._last_geohash = ''
     self._last_n_sats = 0
     self._last_time = self._gpsd.utc
+    self._last_timestamp = self._gpsd.fix.time
+    self._time_formatter = SYSTimesource()
+    # The last parsed (ISO 8601 time, timestamp) pair, see get_timestamp()
+    self._parsed_time = (None, None)
     self._can_run = True
     self.start()
  
@@ -51,6 +58,7 @@ class GPSPoll(threading.Thread):
       currentGeohash = ''
       if self._gpsd.fix.mode != MODE_NO_FIX:
         self._last_time = self._gpsd.utc;
+        self._last_timestamp = self._gpsd.fix.time
         self._last_n_sats = self._gpsd.satellites_used if \
           self._gpsd.satellites_used != NaN else 0
         try:
@@ -97,6 +105,42 @@ class GPSPoll(threading.Thread):
     else:
       return self._last_time
 
+  """ Same as SYSTimesource.get_timestamp(): the time of the last fix in
+  seconds since the epoch, to be formatted lazily by format_time(). Depending
+  on the gpsd version the fix time is a number or an ISO 8601 string, in the
+  latter case it is parsed, falling back to the time returned by get_time().
+  None only if there is no time at all, as for get_time().
+  """
+  def get_timestamp(self):
+    timestamp = self._last_timestamp
+    if isinstance(timestamp, (int, long, float)) and not math.isnan(timestamp):
+      return float(timestamp)
+
+    iso_time = timestamp
+    if not isinstance(iso_time, basestring) or not iso_time:
+      iso_time = self.get_time()
+      if not isinstance(iso_time, basestring) or not iso_time:
+        return None
+
+    # The same fix time is usually asked for many events, parse it once
+    parsed_iso_time, parsed_timestamp = self._parsed_time
+    if iso_time == parsed_iso_time:
+      return parsed_timestamp
+    try:
+      parsed = dateutil.parser.parse(iso_time)
+    except (ValueError, OverflowError):
+      return None
+    parsed_timestamp = calendar.timegm(parsed.utctimetuple()) \
+      + parsed.microsecond / 1000000.0
+    self._parsed_time = (iso_time, parsed_timestamp)
+    return parsed_timestamp
+
+  """ Formats a timestamp returned by get_timestamp() as ISO 8601, see
+  SYSTimesource.format_time()
+  """
+  def format_time(self,timestamp):
+    return self._time_formatter.format_time(timestamp)
+
   """ This function provides an approximated geohash precision by knowing the
   epx and epy values provided by gpsd.
   See:
@@ -133,8 +177,8 @@ class GPSPoll(threading.Thread):
 
     return lastPosition
 
-    """ The stop() function can be used to securely stop the thread that calls
-    the location update callback function.
-    """
-    def stop(self):
-      self._can_run = False
+  """ The stop() function can be used to securely stop the thread that calls
+  the location update callback function.
+  """
+  def stop(self):
+    self._can_run = False
@@ -1,10 +1,76 @@
 class VehicleMessageStreamer(object):
-    message_buffer = b""
-    bytes_received = 0
+    """Base class for the stream parsers of the supported payload formats.
+
+    Received bytes are appended to a single ``bytearray`` and consumed by
+    advancing a read offset, so parsing a message never copies the unparsed
+    tail of the buffer. The consumed head is discarded in one block
+    ("compaction") once it grows past ``COMPACTION_THRESHOLD`` bytes or the
+    buffer is fully drained.
+
+    Counters:
+        bytes_received - total number of bytes received
+        buffer_high_water - largest number of unparsed bytes ever buffered
+        buffer_compactions - number of times unparsed bytes had to be moved
+            to the front of the buffer
+    """
+    COMPACTION_THRESHOLD = 4096
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._offset = 0
+        self.bytes_received = 0
+        self.buffer_high_water = 0
+        self.buffer_compactions = 0
+
+    @property
+    def message_buffer(self):
+        """A copy of the bytes received but not parsed yet."""
+        return bytes(self._buffer[self._offset:])
+
+    @property
+    def buffered_bytes(self):
+        return len(self._buffer) - self._offset
 
     def receive(self, payload):
-        if not isinstance(payload, bytes):
+        if not isinstance(payload, (bytes, bytearray)):
             payload = payload.encode("utf-8")
         if len(payload) > 0:
-            self.message_buffer += payload
+            self._buffer.extend(payload)
             self.bytes_received += len(payload)
+            if self.buffered_bytes > self.buffer_high_water:
+                self.buffer_high_water = self.buffered_bytes
+
+    def parse_next_message(self):
+        raise NotImplementedError("Don't use VehicleMessageStreamer directly")
+
+    def parse_all_messages(self):
+        """Parse every complete message currently buffered.
+
+        Returns a list of the decoded messages, which is empty if no complete
+        message has been received yet. Subclasses should override this with a
+        single pass over the buffer.
+        """
+        messages = []
+        while True:
+            message = self.parse_next_message()
+            if message is None:
+                break
+            messages.append(message)
+        return messages
+
+    def _frame(self, start, end):
+        """Return a copy of the buffered bytes between two absolute
+        positions, without copying anything else.
+        """
+        return memoryview(self._buffer)[start:end].tobytes()
+
+    def _consume(self, position):
+        """Mark everything before the absolute ``position`` as parsed."""
+        self._offset = position
+        if self._offset >= len(self._buffer):
+            del self._buffer[:]
+            self._offset = 0
+        elif self._offset >= self.COMPACTION_THRESHOLD:
+            del self._buffer[:self._offset]
+            self._offset = 0
+            self.buffer_compactions += 1
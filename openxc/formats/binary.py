@@ -6,7 +6,6 @@ import numbers
 import logging
 
 import google.protobuf.message
-from google.protobuf.internal.decoder import _DecodeVarint
 from google.protobuf.internal import encoder
 
 from openxc.formats.base import VehicleMessageStreamer
@@ -16,41 +15,116 @@ LOG = logging.getLogger(__name__)
 
 class UnrecognizedBinaryCommandError(Exception): pass
 
+def _decode_varint(buf, pos):
+    """Decode a base 128 varint from a ``bytearray`` starting at ``pos``.
+
+    Returns a tuple of the decoded value and the position right after it,
+    or ``(None, pos)`` if the buffer ends in the middle of the varint.
+    """
+    result = 0
+    shift = 0
+    length = len(buf)
+    while pos < length:
+        byte = buf[pos]
+        result |= (byte & 0x7f) << shift
+        pos += 1
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+    return None, pos
+
+
 class ProtobufStreamer(VehicleMessageStreamer):
     MAX_PROTOBUF_MESSAGE_LENGTH = 200
+    # Every serialized VehicleMessage starts with its ``type`` field (field
+    # 1, varint), right after a length prefix of at most 2 bytes
+    MESSAGE_TYPE_TAG = b"\x08"
+
+    def __init__(self, raw_can_payloads=False):
+        """Kwargs:
+            raw_can_payloads - if ``True``, the ``data`` of CAN messages is
+                left as a ``bytearray`` instead of being converted to a
+                ``"0x..."`` hex string
+        """
+        super(ProtobufStreamer, self).__init__()
+        self.raw_can_payloads = raw_can_payloads
+
+    def _resync(self, position):
+        """Return the next position worth trying after a failed parse at
+        ``position``, skipping bytes that can't start a length prefixed
+        VehicleMessage.
+        """
+        tag = self._buffer.find(self.MESSAGE_TYPE_TAG, position + 2)
+        if tag == -1:
+            return max(position + 1, len(self._buffer) - 2)
+        return max(position + 1, tag - 2)
 
     def parse_next_message(self):
         message = None
-        remainder = self.message_buffer
-        message_data = ""
 
         # 1. decode a varint from the top of the stream
         # 2. using that as the length, if there's enough in the buffer, try and
         #       decode try and decode a VehicleMessage after the varint
         # 3. if it worked, great, we're oriented in the stream - continue
         # 4. if either couldn't be parsed, skip to the next byte and repeat
-        while message is None and len(self.message_buffer) > 1:
-            message_length, message_start = _DecodeVarint(self.message_buffer, 0)
+        while message is None and self.buffered_bytes > 1:
+            message_length, message_start = _decode_varint(self._buffer,
+                    self._offset)
+            if message_length is None:
+                break
+
             # sanity check to make sure we didn't parse some huge number that's
             # clearly not the length prefix
             if message_length > self.MAX_PROTOBUF_MESSAGE_LENGTH:
-                self.message_buffer = self.message_buffer[1:]
+                self._consume(self._resync(self._offset))
                 continue
 
-            if message_start + message_length > len(self.message_buffer):
+            message_end = message_start + message_length
+            if message_end > len(self._buffer):
                 break
 
-            message_data = self.message_buffer[message_start:message_start +
-                    message_length]
-            remainder = self.message_buffer[message_start + message_length:]
-
-            message = ProtobufFormatter.deserialize(message_data)
+            message = ProtobufFormatter.deserialize(
+                    self._frame(message_start, message_end),
+                    raw_can_payloads=self.raw_can_payloads)
             if message is None:
-                self.message_buffer = self.message_buffer[1:]
+                self._consume(self._resync(self._offset))
+            else:
+                self._consume(message_end)
 
-        self.message_buffer = remainder
         return message
 
+    def parse_all_messages(self):
+        # Same walk as parse_next_message(), but the read position is only
+        # committed once at the end
+        messages = []
+        buf = self._buffer
+        position = self._offset
+        length = len(buf)
+        while length - position > 1:
+            message_length, message_start = _decode_varint(buf, position)
+            if message_length is None:
+                break
+
+            if message_length > self.MAX_PROTOBUF_MESSAGE_LENGTH:
+                position = self._resync(position)
+                continue
+
+            message_end = message_start + message_length
+            if message_end > length:
+                break
+
+            message = ProtobufFormatter.deserialize(
+                    self._frame(message_start, message_end),
+                    raw_can_payloads=self.raw_can_payloads)
+            if message is None:
+                position = self._resync(position)
+            else:
+                messages.append(message)
+                position = message_end
+
+        self._consume(position)
+        return messages
+
     def serialize_for_stream(self, message):
         protobuf_message = ProtobufFormatter.serialize(message)
         delimiter = encoder._VarintBytes(len(protobuf_message))
@@ -59,7 +133,7 @@ class ProtobufStreamer(VehicleMessageStreamer):
 
 class ProtobufFormatter(object):
     @classmethod
-    def deserialize(cls, data):
+    def deserialize(cls, data, raw_can_payloads=False):
         message = openxc_pb2.VehicleMessage()
         try:
             message.ParseFromString(data)
@@ -68,7 +142,7 @@ class ProtobufFormatter(object):
         except UnicodeDecodeError as e:
             LOG.warn("Unable to parse protobuf: %s", e)
         else:
-            return cls._protobuf_to_dict(message)
+            return cls._protobuf_to_dict(message, raw_can_payloads)
 
     @classmethod
     def serialize(cls, data):
@@ -152,9 +226,9 @@ class ProtobufFormatter(object):
                 message.can_message.bus = data['bus']
             if 'frame_format' in data:
                 if data['frame_format'] == "standard":
-                    message.can_message.frame_format = openxc_pb2.RawMessage.STANDARD
+                    message.can_message.frame_format = openxc_pb2.CanMessage.STANDARD
                 elif data['frame_format'] == "extended":
-                    message.can_message.frame_format = openxc_pb2.RawMessage.EXTENDED
+                    message.can_message.frame_format = openxc_pb2.CanMessage.EXTENDED
             message.can_message.id = data['id']
             message.can_message.data = binascii.unhexlify(data['data'].split('0x')[1])
         elif 'id' in data and 'bus' in data and 'mode' in data:
@@ -204,7 +278,7 @@ class ProtobufFormatter(object):
         return message
 
     @classmethod
-    def _protobuf_to_dict(cls, message):
+    def _protobuf_to_dict(cls, message, raw_can_payloads=False):
         parsed_message = {}
         if message is not None:
             if message.type == message.CAN and message.HasField('can_message'):
@@ -214,11 +288,14 @@ class ProtobufFormatter(object):
                 if can_message.HasField('id'):
                     parsed_message['id'] = can_message.id
                 if can_message.HasField('data'):
-                    parsed_message['data'] = "0x%s" % binascii.hexlify(can_message.data)
+                    if raw_can_payloads:
+                        parsed_message['data'] = bytearray(can_message.data)
+                    else:
+                        parsed_message['data'] = "0x%s" % binascii.hexlify(can_message.data)
                 if can_message.HasField('frame_format'):
-                    if can_message.frame_format == openxc_pb2.RawMessage.STANDARD:
+                    if can_message.frame_format == openxc_pb2.CanMessage.STANDARD:
                         parsed_message['frame_format'] = "standard"
-                    elif can_message.frame_format == openxc_pb2.RawMessage.EXTENDED:
+                    elif can_message.frame_format == openxc_pb2.CanMessage.EXTENDED:
                         parsed_message['frame_format'] = "extended"
             elif message.type == message.DIAGNOSTIC:
                 diagnostic_message = message.diagnostic_response
@@ -2,38 +2,101 @@
 from __future__ import absolute_import
 
 import json
+import re
 
 from openxc.formats.base import VehicleMessageStreamer
 
 class JsonStreamer(VehicleMessageStreamer):
     SERIALIZED_COMMAND_TERMINATOR = b"\x00"
 
+    def __init__(self, deserializer=None):
+        """Kwargs:
+            deserializer - function turning one serialized message into a
+                dict, raising ``ValueError`` if it can't. Default is
+                ``JsonFormatter.deserialize_fast``.
+        """
+        super(JsonStreamer, self).__init__()
+        self.deserializer = deserializer or JsonFormatter.deserialize_fast
+
     def parse_next_message(self):
         parsed_message = None
-        remainder = self.message_buffer
-        message = ""
-        if self.SERIALIZED_COMMAND_TERMINATOR in self.message_buffer:
-            message, _, remainder = self.message_buffer.partition(
-                    self.SERIALIZED_COMMAND_TERMINATOR)
+        end = self._buffer.find(self.SERIALIZED_COMMAND_TERMINATOR,
+                self._offset)
+        if end != -1:
+            message = self._frame(self._offset, end)
+            self._consume(end + 1)
             try:
-                parsed_message = JsonFormatter.deserialize(message)
+                parsed_message = self.deserializer(message)
                 if not isinstance(parsed_message, dict):
                     raise ValueError()
             except ValueError:
-                pass
-        self.message_buffer = remainder
+                parsed_message = None
         return parsed_message
 
+    def parse_all_messages(self):
+        messages = []
+        end = self._buffer.rfind(self.SERIALIZED_COMMAND_TERMINATOR,
+                self._offset)
+        if end != -1:
+            frames = self._frame(self._offset, end).split(
+                    self.SERIALIZED_COMMAND_TERMINATOR)
+            self._consume(end + 1)
+            for frame in frames:
+                try:
+                    parsed_message = self.deserializer(frame)
+                except ValueError:
+                    continue
+                if isinstance(parsed_message, dict):
+                    messages.append(parsed_message)
+        return messages
+
     def serialize_for_stream(self, message):
         return JsonFormatter.serialize(
                 message) + self.SERIALIZED_COMMAND_TERMINATOR
 
 class JsonFormatter(object):
+    # A raw CAN message as sent by the VI firmware, with the optional bus
+    # either first or last, e.g. ``{"bus": 1, "id": 1234, "data": "0x1234"}``
+    RAW_CAN_MESSAGE = re.compile(br'\s*\{\s*(?:"bus"\s*:\s*(\d+)\s*,\s*)?'
+            br'"id"\s*:\s*(\d+)\s*,\s*"data"\s*:\s*"(0x[0-9a-fA-F]*)"\s*'
+            br'(?:,\s*"bus"\s*:\s*(\d+)\s*)?\}\s*$')
 
     @classmethod
     def deserialize(cls, message):
         return json.loads(message.decode("utf8"))
 
+    @classmethod
+    def deserialize_raw_can(cls, message):
+        """Decode a raw CAN message made only of the ``id``, ``data`` and
+        optional ``bus`` members with a single regular expression, without
+        going through the json module.
+
+        Returns:
+            The same dict ``deserialize`` would return, or ``None`` if the
+            message has any other shape.
+        """
+        match = cls.RAW_CAN_MESSAGE.match(message)
+        if match is None:
+            return None
+
+        bus, message_id, data, trailing_bus = match.groups()
+        parsed_message = {'id': int(message_id), 'data': data.decode("ascii")}
+        bus = bus or trailing_bus
+        if bus is not None:
+            parsed_message['bus'] = int(bus)
+        return parsed_message
+
+    @classmethod
+    def deserialize_fast(cls, message):
+        """Decode raw CAN messages with ``deserialize_raw_can`` and fall back
+        to the full JSON parser for everything else (command responses,
+        translated and diagnostic messages).
+        """
+        parsed_message = cls.deserialize_raw_can(message)
+        if parsed_message is None:
+            parsed_message = cls.deserialize(message)
+        return parsed_message
+
     @classmethod
     def serialize(cls, data):
         return json.dumps(data).encode("utf8")
@@ -5,6 +5,7 @@ import threading
 import logging
 import string
 import sys
+import time
 import datetime
 
 from openxc.formats.binary import ProtobufStreamer, ProtobufFormatter
@@ -21,9 +22,16 @@ class DataSource(threading.Thread):
     process to read data, it's just a matter of defining a ``run()`` method.
 
     A data source requires a callback method to be specified. Whenever new data
-    is received, it will pass it to that callback.
+    is received, it will pass it to that callback. A batch callback can be
+    specified as well (or instead), which receives lists of messages so the
+    per-message overhead of the receiver is paid once per batch.
     """
-    def __init__(self, callback=None, log_mode=None, payload_format=None):
+    DEFAULT_MAX_BATCH_SIZE = 64
+    DEFAULT_MAX_BATCH_LATENCY = 0
+
+    def __init__(self, callback=None, log_mode=None, payload_format=None,
+            batch_callback=None, max_batch_size=None, max_batch_latency=None,
+            raw_can_payloads=False):
         """Construct a new DataSource.
 
         By default, DataSource threads are marked as ``daemon`` threads, so they
@@ -32,13 +40,27 @@ class DataSource(threading.Thread):
 
         Kwargs:
             callback - function to call with any new data received
+            batch_callback - function to call with a list of new messages
+            max_batch_size - a batch is delivered as soon as it holds this
+                many messages (default is 64)
+            max_batch_latency - number of seconds a partial batch can be held
+                back waiting for more messages. It is only checked after each
+                read, and the default of 0 delivers one batch per read.
+            raw_can_payloads - with the protobuf format, pass the data of CAN
+                messages on as a ``bytearray`` instead of a hex string
         """
         super(DataSource, self).__init__()
         self.callback = callback
+        self.batch_callback = batch_callback
+        self.max_batch_size = max_batch_size or self.DEFAULT_MAX_BATCH_SIZE
+        if max_batch_latency is None:
+            max_batch_latency = self.DEFAULT_MAX_BATCH_LATENCY
+        self.max_batch_latency = max_batch_latency
         self.daemon = True
         self.running = True
         self._streamer = None
         self._formatter = None
+        self.raw_can_payloads = raw_can_payloads
         self.format = payload_format
 
         self.logger = SourceLogger(self, log_mode)
@@ -54,7 +76,8 @@ class DataSource(threading.Thread):
             self.streamer = JsonStreamer()
             self.formatter = JsonFormatter
         elif value == "protobuf":
-            self.streamer = ProtobufStreamer()
+            self.streamer = ProtobufStreamer(
+                    raw_can_payloads=self.raw_can_payloads)
             self.formatter = ProtobufFormatter
 
     @property
@@ -83,6 +106,14 @@ class DataSource(threading.Thread):
     def bytes_received(self):
         return self.streamer.bytes_received
 
+    @property
+    def buffer_high_water(self):
+        return self.streamer.buffer_high_water
+
+    @property
+    def buffer_compactions(self):
+        return self.streamer.buffer_compactions
+
     def start(self):
         self.logger.start()
         super(DataSource, self).start()
@@ -169,6 +200,9 @@ class BytestreamDataSource(DataSource):
 
     Subclasses of this class need only to implement the ``read`` method.
     """
+    # Payloads made only of these characters are assumed to be JSON when
+    # auto-detecting the payload format
+    JSON_CHARS = frozenset('\x00' + string.printable)
 
     def __init__(self, **kwargs):
         super(BytestreamDataSource, self).__init__(**kwargs)
@@ -178,8 +212,9 @@ class BytestreamDataSource(DataSource):
     def _message_valid(self, message):
         if not hasattr(message, '__iter__'):
             return False
-        if not ('name' in message and 'value' in message or
-                    ('id' in message and 'data' in message) or
+        # Raw CAN messages are by far the most common, check them first
+        if not (('id' in message and 'data' in message) or
+                    'name' in message and 'value' in message or
                     ('id' in message and 'bus' in message) or
                     'command_response' in message):
             return False
@@ -188,8 +223,11 @@ class BytestreamDataSource(DataSource):
     def run(self):
         """Continuously read data from the source and attempt to parse a valid
         message from the buffer of bytes. When a message is parsed, passes it
-        off to the callback if one is set.
+        off to the callback if one is set, and collects it in a batch for the
+        batch callback if that is set.
         """
+        batch = []
+        batch_started = 0
         while self.running:
             try:
                 payload = self.read()
@@ -201,27 +239,38 @@ class BytestreamDataSource(DataSource):
             try:
                 self.streamer
             except MissingPayloadFormatError:
-                json_chars = ['\x00']
-                json_chars.extend(string.printable)
-                if all((char in json_chars for char in payload)):
+                if not payload:
+                    continue
+                if all((char in self.JSON_CHARS for char in payload)):
                     self.format = "json"
                 else:
                     self.format = "protobuf"
             self.streamer.receive(payload)
 
-            while True:
-                message = self.streamer.parse_next_message()
-                if message is None:
-                    break
-
+            for message in self.streamer.parse_all_messages():
                 if not self._message_valid(message):
                     self.corrupted_messages += 1
-                    break
+                    continue
 
                 if self.callback is not None:
                     self.callback(message)
+                if self.batch_callback is not None:
+                    if len(batch) == 0:
+                        batch_started = time.time()
+                    batch.append(message)
+                    if len(batch) >= self.max_batch_size:
+                        self.batch_callback(batch)
+                        batch = []
                 self._receive_command_response(message)
 
+            if (len(batch) > 0 and
+                    time.time() - batch_started >= self.max_batch_latency):
+                self.batch_callback(batch)
+                batch = []
+
+        if len(batch) > 0:
+            self.batch_callback(batch)
+
     def _receive_command_response(self, message):
         # TODO the controller/source are getting a litlte mixed up since the
         # controller now needs to receive responses from the soruce side, maybe
@@ -2,6 +2,7 @@
 from __future__ import absolute_import
 
 import logging
+from multiprocessing.pool import ThreadPool
 
 from openxc.controllers.base import Controller
 from .socket import SocketDataSource
@@ -21,9 +22,25 @@ except ImportError:
 
 class BluetoothVehicleInterface(SocketDataSource, Controller):
     """A data source reading from a bluetooth device.
+
+    pybluez is only used through the module level ``bluetooth`` name, and
+    the retry delays through ``time.sleep``, so both can be replaced, e.g.
+    to exercise the scan and the connection retries with a fake
+    ``bluetooth`` module and no device.
     """
 
     OPENXC_DEVICE_NAME_PREFIX = "OpenXC-VI-"
+    MAX_NAME_LOOKUP_THREADS = 4
+    # Seconds a device found not to be an OpenXC VI is skipped by the scan
+    NON_OPENXC_DEVICE_TTL = 600
+    CONNECTION_ATTEMPTS = 4
+    INITIAL_CONNECTION_RETRY_DELAY = 0.5
+    MAX_CONNECTION_RETRY_DELAY = 8
+
+    # Address of every nearby device known not to be an OpenXC VI, mapped to
+    # the time its entry expires. It is shared by all instances so that the
+    # names don't have to be looked up again at every reconnection.
+    _non_openxc_devices = {}
 
     def __init__(self, address=None, **kwargs):
         """Initialize a connection to the bluetooth device.
@@ -47,15 +64,15 @@ class BluetoothVehicleInterface(SocketDataSource, Controller):
             while self.address is None:
                 self.scan_for_bluetooth_device()
 
-            # 4 connection tentatives before resetting the address
-            i=0
-            while i<4:
+            # A few connection tentatives, waiting twice as long after every
+            # failure, before resetting the address
+            delay = self.INITIAL_CONNECTION_RETRY_DELAY
+            for _ in range(self.CONNECTION_ATTEMPTS):
                 connected = self.connect()
-                if not connected:
-                    time.sleep(1)
-                    i=i+1
-                else:
+                if connected:
                     break
+                time.sleep(delay)
+                delay = min(delay * 2, self.MAX_CONNECTION_RETRY_DELAY)
 
             if not connected:
                 self.address = None
@@ -70,7 +87,8 @@ class BluetoothVehicleInterface(SocketDataSource, Controller):
         try:
             self.socket.connect((self.address, port))
         except IOError as e:
-            LOG.warn("Unable to connect to %s" % self.address, e)
+            LOG.warn("Unable to connect to %s: %s", self.address, e)
+            self.socket.close()
         else:
             LOG.info("Opened bluetooth device at %s", port)
             connected = True
@@ -83,16 +101,44 @@ class BluetoothVehicleInterface(SocketDataSource, Controller):
         self.socket.close()
 
     def scan_for_bluetooth_device(self):
+        """Look for a nearby OpenXC VI and store its address in
+        ``self.address``, which is left to ``None`` if none is found.
+
+        The names of the discovered devices are looked up concurrently, and
+        devices already known not to be a VI are not looked up at all.
+        """
         nearby_devices = bluetooth.discover_devices()
 
+        now = time.time()
+        for address, expiration in list(self._non_openxc_devices.items()):
+            if expiration <= now:
+                del self._non_openxc_devices[address]
+        candidates = [address for address in nearby_devices
+                if address not in self._non_openxc_devices]
+
+        device_names = []
+        if len(candidates) > 0:
+            pool = ThreadPool(min(len(candidates),
+                    self.MAX_NAME_LOOKUP_THREADS))
+            try:
+                device_names = pool.map(bluetooth.lookup_name, candidates)
+            finally:
+                pool.close()
+                pool.join()
+
         self.address = None
         device_name = None
-        for address in nearby_devices:
-            device_name = bluetooth.lookup_name(address)
-            if (device_name is not None and
-                    device_name.startswith(self.OPENXC_DEVICE_NAME_PREFIX)):
-                self.address = address
-                break
+        for address, name in zip(candidates, device_names):
+            if name is None:
+                # The lookup failed, it may still be a VI
+                continue
+            if name.startswith(self.OPENXC_DEVICE_NAME_PREFIX):
+                if self.address is None:
+                    self.address = address
+                    device_name = name
+            else:
+                self._non_openxc_devices[address] = (now +
+                        self.NON_OPENXC_DEVICE_TTL)
 
         if self.address is not None:
             LOG.info("Discovered OpenXC VI %s (%s)" % (device_name, self.address))
@@ -20,13 +20,16 @@ class SerialDataSource(BytestreamDataSource):
     """
     DEFAULT_PORT = "/dev/ttyUSB0"
     DEFAULT_BAUDRATE = 230400
+    DEFAULT_READ_SIZE = 4096
 
-    def __init__(self, port=None, baudrate=None, **kwargs):
+    def __init__(self, port=None, baudrate=None, read_size=None, **kwargs):
         """Initialize a connection to the serial device.
 
         Kwargs:
             port - optionally override the default virtual COM port
             baudrate - optionally override the default baudrate
+            read_size - maximum number of bytes returned by a single read
+                (default is 4096)
 
         Raises:
             DataSourceError if the serial device cannot be opened.
@@ -34,6 +37,7 @@ class SerialDataSource(BytestreamDataSource):
         super(SerialDataSource, self).__init__(**kwargs)
         port = port or self.DEFAULT_PORT
         baudrate = baudrate or self.DEFAULT_BAUDRATE
+        self.read_size = read_size or self.DEFAULT_READ_SIZE
 
         if serial is None:
             raise DataSourceError("pyserial library is not available")
@@ -47,4 +51,16 @@ class SerialDataSource(BytestreamDataSource):
             LOG.debug("Opened serial device at %s", port)
 
     def read(self):
-        return self.device.read()
+        """Return everything already waiting in the input buffer, up to
+        ``read_size`` bytes, blocking only until the first byte arrives if the
+        buffer is empty.
+        """
+        waiting = self._bytes_waiting()
+        return self.device.read(min(max(waiting, 1), self.read_size))
+
+    def _bytes_waiting(self):
+        try:
+            return self.device.in_waiting
+        except AttributeError:
+            # pyserial < 3.0
+            return self.device.inWaiting()
@@ -7,19 +7,45 @@ import socket
 
 
 class SocketDataSource(BytestreamDataSource):
+    """A source reading from a connected stream socket.
+
+    Data is pulled from the socket in blocks of up to ``read_size`` bytes and
+    buffered internally, so only complete ``\\x00``-delimited messages are
+    handed to the streamer. Any trailing partial message is kept until the
+    next call to ``read()``.
+    """
+    DEFAULT_READ_SIZE = 4096
+    MESSAGE_DELIMITER = b"\x00"
+
+    def __init__(self, read_size=None, **kwargs):
+        """Kwargs:
+            read_size - maximum number of bytes requested from the socket on
+                each receive call (default is 4096)
+        """
+        super(SocketDataSource, self).__init__(**kwargs)
+        self.read_size = read_size or self.DEFAULT_READ_SIZE
+        self._read_buffer = bytearray()
+
     def read(self):
         try:
-            line = ""
-            while '\x00' not in line:
-                # TODO this is fairly inefficient
-                line += self.socket.recv(1)
+            end = self._read_buffer.rfind(self.MESSAGE_DELIMITER)
+            while end == -1:
+                chunk = self.socket.recv(self.read_size)
+                if not chunk:
+                    break
+                end = len(self._read_buffer)
+                self._read_buffer.extend(chunk)
+                end = self._read_buffer.rfind(self.MESSAGE_DELIMITER, end)
         except (OSError, socket.error, IOError) as e:
             raise DataSourceError("Unable to read from socket connection")
-                
-        if not line:
+
+        if end == -1:
             raise DataSourceError("Unable to read from socket connection")
-            
-        return line
+
+        end += 1
+        messages = bytes(self._read_buffer[:end])
+        del self._read_buffer[:end]
+        return messages
 
     def write_bytes(self, data):
         return self.socket.send(data)
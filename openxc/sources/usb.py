@@ -1,6 +1,7 @@
 """A USB vehicle interface data source."""
 from __future__ import absolute_import
 
+import array
 import logging
 import usb.core
 import usb.util
@@ -9,12 +10,53 @@ from .base import BytestreamDataSource, DataSourceError
 
 LOG = logging.getLogger(__name__)
 
+try:
+    memoryview(array.array('B'))
+except TypeError:
+    # Python 2 arrays only implement the old buffer interface
+    def _array_to_bytes(data, length):
+        return str(buffer(data, 0, length))
+else:
+    def _array_to_bytes(data, length):
+        return memoryview(data)[:length].tobytes()
+
+
+class UsbReadStats(object):
+    """Counters about the reads of vehicle data from a USB device.
+
+    Attributes:
+        read_size - the current read request size
+        reads - number of reads that returned data
+        bytes_read - total number of bytes read
+        full_reads - number of reads that filled the whole request
+        timeouts - number of reads that timed out without any data
+        grows, shrinks - number of times the read request size was changed
+    """
+    def __init__(self, read_size):
+        self.read_size = read_size
+        self.reads = 0
+        self.bytes_read = 0
+        self.full_reads = 0
+        self.timeouts = 0
+        self.grows = 0
+        self.shrinks = 0
+
+    def __repr__(self):
+        return ("UsbReadStats(read_size=%d, reads=%d, bytes_read=%d, "
+                "full_reads=%d, timeouts=%d, grows=%d, shrinks=%d)" % (
+                    self.read_size, self.reads, self.bytes_read,
+                    self.full_reads, self.timeouts, self.grows, self.shrinks))
+
 
 class UsbDataSource(BytestreamDataSource):
     """A source to receive data from an OpenXC vehicle interface via USB."""
     DEFAULT_VENDOR_ID = 0x1bc4
     DEFAULT_PRODUCT_ID = 0x0001
     DEFAULT_READ_REQUEST_SIZE = 512
+    # The read request size doubles every time a read comes back full, and
+    # halves every time a read times out, within these limits
+    MIN_READ_REQUEST_SIZE = 64
+    MAX_READ_REQUEST_SIZE = 16384
 
     # If we don't get DEFAULT_READ_REQUEST_SIZE bytes within this number of
     # milliseconds, bail early and return whatever we have - could be zero,
@@ -27,7 +69,8 @@ class UsbDataSource(BytestreamDataSource):
     VEHICLE_DATA_IN_ENDPOINT = 2
     LOG_IN_ENDPOINT = 11
 
-    def __init__(self, vendor_id=None, product_id=None, **kwargs):
+    def __init__(self, vendor_id=None, product_id=None, read_size=None,
+            read_timeout=None, **kwargs):
         """Initialize a connection to the USB device's IN endpoint.
 
         Kwargs:
@@ -42,11 +85,23 @@ class UsbDataSource(BytestreamDataSource):
             log_mode - optionally record or print logs from the USB device, which
                 are on a separate channel.
 
+            read_size (int) - initial size of the vehicle data read requests,
+                which then adapts to the data rate (default is 512).
+
+            read_timeout (int) - milliseconds to wait for data before giving
+                up on a read (default is 200).
+
         Raises:
             DataSourceError if the USB device with the given vendor ID is not
             connected.
         """
         super(UsbDataSource, self).__init__(**kwargs)
+        self.read_timeout = read_timeout or self.DEFAULT_READ_TIMEOUT
+        self.read_stats = UsbReadStats(
+                read_size or self.DEFAULT_READ_REQUEST_SIZE)
+        self._read_buffer = array.array('B',
+                [0]) * self.read_stats.read_size
+
         if vendor_id is not None and not isinstance(vendor_id, int):
             vendor_id = int(vendor_id, 0)
         self.vendor_id = vendor_id or self.DEFAULT_VENDOR_ID
@@ -69,7 +124,31 @@ class UsbDataSource(BytestreamDataSource):
         raise DataSourceError("No USB vehicle interface detected - is one plugged in?")
 
     def read(self, timeout=None):
-        return self._read(self.VEHICLE_DATA_IN_ENDPOINT, timeout)
+        """Read vehicle data into a buffer reused across reads, adapting the
+        size of the request to the data rate. See ``read_stats``.
+        """
+        timeout = timeout or self.read_timeout
+        stats = self.read_stats
+        try:
+            length = self.device.read(0x80 + self.VEHICLE_DATA_IN_ENDPOINT,
+                    self._read_buffer, timeout)
+        except (usb.core.USBError, AttributeError) as e:
+            if getattr(e, 'errno', None) == 110:
+                # Timeout, it may just not be sending
+                stats.timeouts += 1
+                self._resize_read_buffer(max(stats.read_size // 2,
+                        self.MIN_READ_REQUEST_SIZE))
+                return ""
+            raise DataSourceError("USB device couldn't be read", e)
+
+        stats.reads += 1
+        stats.bytes_read += length
+        data = _array_to_bytes(self._read_buffer, length)
+        if length == stats.read_size:
+            stats.full_reads += 1
+            self._resize_read_buffer(min(stats.read_size * 2,
+                    self.MAX_READ_REQUEST_SIZE))
+        return data
 
     def read_logs(self, timeout=None):
         return self._read(self.LOG_IN_ENDPOINT, timeout, 64)
@@ -78,15 +157,26 @@ class UsbDataSource(BytestreamDataSource):
         super(UsbDataSource, self).stop()
         usb.util.dispose_resources(self.device)
 
+    def _resize_read_buffer(self, read_size):
+        stats = self.read_stats
+        if read_size > stats.read_size:
+            stats.grows += 1
+        elif read_size < stats.read_size:
+            stats.shrinks += 1
+        else:
+            return
+        stats.read_size = read_size
+        self._read_buffer = array.array('B', [0]) * read_size
+
     def _read(self, endpoint_address, timeout=None,
             read_size=DEFAULT_READ_REQUEST_SIZE):
-        timeout = timeout or self.DEFAULT_READ_TIMEOUT
+        timeout = timeout or self.read_timeout
         try:
-            return self.device.read(0x80 + endpoint_address,
-                    read_size, self.DEFAULT_INTERFACE_NUMBER, timeout
-                    ).tostring()
+            data = self.device.read(0x80 + endpoint_address, read_size,
+                    timeout)
+            return _array_to_bytes(data, len(data))
         except (usb.core.USBError, AttributeError) as e:
-            if e.errno == 110:
+            if getattr(e, 'errno', None) == 110:
                 # Timeout, it may just not be sending
                 return ""
             raise DataSourceError("USB device couldn't be read", e)
@@ -1,6 +1,9 @@
 from .threadedparser import ThreadedParser
 from .canparser import CANParser
+from .canparserpool import CANParserPool
 from .obdparser import OBDParser
 from .collaboxoutletparser import CollaboxOutletParser
 from .nullparser import NullParser
-from .vtpocparser import VTPocParser
\ No newline at end of file
+from .vtpocparser import VTPocParser
+from .candecoder import MessageDecoder, SignalDecoder
+from .batchdecoder import BatchDecoder, frames_to_arrays
@@ -0,0 +1,178 @@
+"""
+This module contains a decoder extracting the configured CAN signals from
+recorded CAN data in bulk, for offline analysis. It requires numpy.
+"""
+
+__author__ = "Dario Fiumicello"
+__email__ = "dario.fiumicello@gmail.com"
+
+from .canparser import CANParser
+from .candecoder import payload_to_long
+import calendar
+import dateutil.parser
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+class BatchDecoder():
+	"""
+	A BatchDecoder decodes whole arrays of CAN frames at once with numpy,
+	using the MessageDecoders compiled by CANParser from can.json. It gives
+	the same values as CANParser for every frame: the bits are numbered from
+	the MSB of the payload in the same way, the states are looked up in the
+	same way, and the factor and offset are applied in the same order.
+
+	Unlike CANParser, every frame is decoded: max_frequency, send_same and
+	force_send_changed are not applied. Raw signals are not decoded.
+	"""
+
+	def __init__(self,decoders):
+		if numpy is None:
+			raise ImportError("BatchDecoder requires numpy")
+		self._decoders = decoders
+
+	"""
+	Builds a BatchDecoder for the messages configured in a can.json file
+	"""
+	@classmethod
+	def from_file(cls,conf_file="can.json"):
+		parser = CANParser(None,conf_file)
+		parser.stop()
+		return cls(parser.get_decoders())
+
+	"""
+	Decodes the frames given as arrays (or lists) of timestamps, CAN IDs and
+	payloads, each payload being an unsigned 64 bit integer. bit_lengths is
+	the length of the payloads in bits, either for all the frames or as an
+	array; it is 64 for 8 byte payloads.
+	Returns a dictionary mapping the generic name of every signal found in
+	the frames to a (timestamps, values) tuple of arrays, in the order of
+	the frames. The values of the signals with states are their state names,
+	None for the raw values without a state.
+	The raw signals are skipped, there is nothing to extract from them: the
+	frames of the messages configured as raw give nothing.
+	"""
+	def decode(self,timestamps,ids,payloads,bit_lengths=64):
+		timestamps = numpy.asarray(timestamps)
+		ids = numpy.asarray(ids)
+		payloads = numpy.asarray(payloads, dtype=numpy.uint64)
+		bit_lengths = numpy.asarray(bit_lengths, dtype=numpy.int64)
+
+		# generic_name -> list of (rows, values), see _merge()
+		columns = {}
+		for can_id in numpy.unique(ids):
+			decoder = self._decoders.get(int(can_id))
+			if decoder is None or not decoder.signals:
+				continue
+
+			rows = numpy.flatnonzero(ids == can_id)
+			message_payloads = payloads[rows]
+			message_bit_lengths = bit_lengths if bit_lengths.ndim == 0 \
+				else bit_lengths[rows]
+			for signal in decoder.signals:
+				shift = message_bit_lengths - signal.end
+				# The frames too short for the signal are skipped, CANParser
+				# would fail on them
+				fits = shift >= 0
+				if shift.ndim == 0 and not fits:
+					continue
+				if not numpy.all(fits):
+					signal_rows = rows[fits]
+					signal_payloads = message_payloads[fits]
+					shift = shift[fits]
+				else:
+					signal_rows = rows
+					signal_payloads = message_payloads
+				raw_values = (signal_payloads >> shift.astype(numpy.uint64)) \
+					& numpy.uint64(signal.mask)
+				columns.setdefault(signal.generic_name, []).append( \
+					(signal_rows, self._convert(signal,raw_values)))
+
+		return dict((name, self._merge(timestamps,parts)) \
+			for name, parts in columns.items())
+
+	"""
+	Converts the raw values of a signal, see SignalDecoder.convert(). States
+	are looked up in the dense state table if any, otherwise once per
+	distinct raw value.
+	"""
+	def _convert(self,signal,raw_values):
+		if isinstance(signal.state_table, list):
+			state_table = numpy.empty(len(signal.state_table), dtype=object)
+			state_table[:] = signal.state_table
+			return state_table[raw_values.astype(numpy.intp)]
+
+		if signal.states is not None:
+			distinct, inverse = numpy.unique(raw_values, return_inverse=True)
+			states = numpy.empty(len(distinct), dtype=object)
+			states[:] = [signal.convert(long(raw_value)) \
+				for raw_value in distinct]
+			return states[inverse]
+
+		if signal.bit_size < 64:
+			raw_values = raw_values.astype(numpy.int64)
+		return raw_values * signal.factor + signal.offset
+
+	"""
+	Returns the (timestamps, values) arrays of a signal, from its parts
+	decoded from one or more messages
+	"""
+	def _merge(self,timestamps,parts):
+		if len(parts) == 1:
+			rows, values = parts[0]
+		else:
+			rows = numpy.concatenate([part[0] for part in parts])
+			values = numpy.concatenate([part[1] for part in parts])
+			order = numpy.argsort(rows, kind='mergesort')
+			rows, values = rows[order], values[order]
+		return timestamps[rows], values
+
+
+"""
+Converts recorded CAN frames, as dictionaries with "id", "data" and
+optionally "timestamp" keys, to the arrays taken by BatchDecoder.decode().
+The frames can come from an OpenXC trace or from the raw CAN events logged
+by JSONFileConsumer, where the ID is an hex string and the time is the ISO
+8601 "time" string, converted to seconds since the epoch (UTC if it has no
+time zone). Frames with neither get NaN.
+Returns a (timestamps, ids, payloads, bit_lengths) tuple of arrays.
+"""
+def frames_to_arrays(frames):
+	if numpy is None:
+		raise ImportError("frames_to_arrays requires numpy")
+	timestamps = []
+	ids = []
+	payloads = []
+	bit_lengths = []
+	for frame in frames:
+		can_id = frame['id']
+		if isinstance(can_id, basestring):
+			# hex() of a long has a trailing "L"
+			can_id = long(can_id.rstrip('L'),16)
+		payload, bit_length = payload_to_long(frame['data'])
+		if bit_length > 64:
+			raise ValueError("Payloads longer than 8 bytes are not supported")
+		timestamp = frame.get('timestamp')
+		if timestamp is None:
+			timestamp = iso_to_timestamp(frame['time']) if 'time' in frame \
+				else float('nan')
+		timestamps.append(timestamp)
+		ids.append(can_id)
+		payloads.append(payload)
+		bit_lengths.append(bit_length)
+	return numpy.array(timestamps, dtype=numpy.float64) \
+		,numpy.array(ids, dtype=numpy.int64) \
+		,numpy.array(payloads, dtype=numpy.uint64) \
+		,numpy.array(bit_lengths, dtype=numpy.int64)
+
+
+"""
+Converts an ISO 8601 time, as given by SYSTimesource, to seconds since the
+epoch. A time without a time zone is taken as UTC.
+"""
+def iso_to_timestamp(iso_time):
+	parsed = dateutil.parser.parse(iso_time)
+	return calendar.timegm(parsed.utctimetuple()) \
+		+ parsed.microsecond / 1000000.0
@@ -0,0 +1,154 @@
+"""
+This module contains the decoders compiled from the can.json configuration,
+used by CANParser to extract the signals from the CAN messages
+"""
+
+__author__ = "Dario Fiumicello"
+__email__ = "dario.fiumicello@gmail.com"
+
+import binascii
+import struct
+
+# A whole classic CAN payload as a big endian unsigned integer
+_UINT64 = struct.Struct('>Q')
+
+"""
+Converts the payload of a CAN message, either its "0x..." hex string or the
+raw payload as a bytearray, to a (value, bit_length) tuple, value being the
+whole payload as an integer.
+Raw payloads of up to 8 bytes are unpacked directly, padded with leading
+zero bytes when shorter; only longer ones go through an hex string.
+"""
+def payload_to_long(payload):
+	if isinstance(payload, bytearray):
+		length = len(payload)
+		if length == 8:
+			return _UINT64.unpack_from(payload)[0], 64
+		if length < 8:
+			return _UINT64.unpack(bytes(payload).rjust(8,'\0'))[0], length*8
+		return long(binascii.hexlify(payload),16), length*8
+	return long(payload,16), (len(payload)-2)*4
+
+
+class SignalDecoder(object):
+	"""
+	A SignalDecoder holds everything needed to extract a configured signal
+	from a CAN message, already resolved from the signal configuration (see
+	CANParser._conf_check()), along with the state of its notifications.
+
+	Bits are numbered from the MSB of the payload, as in the configuration:
+	the signal is the bit_size bits ending "end" bits after the MSB, so it
+	is extracted from the payload value shifting it right by
+	bit_length - end and masking it.
+
+	The states of a signal are inverted into a table from the raw values to
+	the state names: a list indexed by the raw value when the signal has at
+	most DENSE_STATES_MAX_BITS bits, a dictionary otherwise. As when the
+	states were searched in order, the first state listing a raw value wins.
+	"""
+
+	DENSE_STATES_MAX_BITS = 8
+
+	__slots__ = ('generic_name', 'bit_start', 'bit_size', 'end', 'mask' \
+		,'factor', 'offset', 'states', 'max_frequency', 'min_period' \
+		,'send_same', 'force_send_changed', 'last_value', 'last_change_ts' \
+		,'value', 'state_table', 'unmapped')
+
+	def __init__(self,signal_conf):
+		self.generic_name = signal_conf['generic_name']
+		self.bit_start = int(signal_conf['bit_start'])
+		self.bit_size = int(signal_conf['bit_size'])
+		self.end = self.bit_start + self.bit_size
+		self.mask = long((1 << self.bit_size) - 1)
+		self.factor = signal_conf['factor']
+		self.offset = signal_conf['offset']
+		self.states = signal_conf.get('states')
+		self.state_table = self._build_state_table() \
+			if self.states is not None else None
+		# Number of notified raw values without a state
+		self.unmapped = 0
+		self.max_frequency = signal_conf['max_frequency']
+		self.min_period = 1.0/self.max_frequency \
+			if self.max_frequency != 0 else 0
+		self.send_same = signal_conf['send_same']
+		self.force_send_changed = signal_conf['force_send_changed']
+		self.last_value = None
+		self.last_change_ts = 0
+		# The raw value in the last decoded payload, whether notified or not
+		self.value = None
+
+	"""
+	Returns the raw value of the signal in a payload, given as returned by
+	payload_to_long()
+	"""
+	def raw_value(self,value,bit_length):
+		return (value >> (bit_length - self.end)) & self.mask
+
+	"""
+	Converts a raw value of the signal to the value to be notified: the
+	name of its state or the raw value scaled by factor and offset. None is
+	returned for a raw value without a state.
+	"""
+	def convert(self,raw_value):
+		state_table = self.state_table
+		if state_table is not None:
+			if state_table.__class__ is list:
+				return state_table[raw_value]
+			return state_table.get(raw_value)
+		return raw_value * self.factor + self.offset
+
+	def _build_state_table(self):
+		if self.bit_size <= self.DENSE_STATES_MAX_BITS:
+			state_table = [None] * (1 << self.bit_size)
+			for state, raw_values in self.states.iteritems():
+				for raw_value in raw_values:
+					# Values that are not integers or out of the signal range
+					# could never match
+					if isinstance(raw_value, (int, long, float)) \
+						and raw_value == int(raw_value) \
+						and 0 <= raw_value < len(state_table) \
+						and state_table[int(raw_value)] is None:
+						state_table[int(raw_value)] = state
+		else:
+			state_table = {}
+			for state, raw_values in self.states.iteritems():
+				for raw_value in raw_values:
+					state_table.setdefault(raw_value, state)
+		return state_table
+
+
+class MessageDecoder(object):
+	"""
+	A MessageDecoder holds the SignalDecoders of a configured CAN message.
+	A message without signals is a raw one, to be notified as it is. The
+	decision is taken per signal: a message with both raw and decoded
+	signals is notified as it is and its decoded signals are extracted.
+
+	last_payload is what CANParser compared to tell if the last payload of
+	the message changed, see CANParser.CHANGE_DETECTION.
+	"""
+
+	__slots__ = ('can_id', 'raw', 'signals', 'last_payload', '_signal_bits')
+
+	def __init__(self,can_id,message_conf):
+		self.can_id = can_id
+		signals = message_conf['signals'].values()
+		self.raw = any(signal.get('raw') is True for signal in signals)
+		self.signals = tuple(SignalDecoder(signal) \
+			for signal in signals if signal.get('raw') is not True)
+		self.last_payload = None
+		self._signal_bits = {}
+
+	"""
+	Returns the mask of the bits of a payload of bit_length bits that belong
+	to any signal of the message
+	"""
+	def signal_bits(self,bit_length):
+		mask = self._signal_bits.get(bit_length)
+		if mask is None:
+			mask = 0L
+			for signal in self.signals:
+				if bit_length >= signal.end:
+					mask |= signal.mask << (bit_length - signal.end)
+			self._signal_bits[bit_length] = mask
+		return mask
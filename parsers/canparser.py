@@ -7,6 +7,9 @@ __author__ = "Dario Fiumicello"
 __email__ = "dario.fiumicello@gmail.com"
 
 from .threadedparser import ThreadedParser
+from .candecoder import MessageDecoder, payload_to_long
+from eventmanager import Event
+import binascii
 import json
 import math
 import time
@@ -17,18 +20,38 @@ class CANParser(ThreadedParser):
 	"""
 	CANParser reads the file can.json and parse the required CAN signals from
 	received can messages.
+
+	Many messages are received again and again with the same payload, so the
+	last payload of every message is kept and, as long as it does not
+	change, the signals are not extracted again: only the max_frequency and
+	send_same rules are evaluated. CHANGE_DETECTION tells what is compared:
+	- SAME_PAYLOAD: the payload as received, byte by byte.
+	- SAME_SIGNAL_BITS: only the bits of the configured signals, so that the
+	  changes of anything else in the message (e.g. counters or checksums)
+	  are ignored. The payload is always converted to an integer.
+	- None: the signals are extracted from every payload.
+	The notified events are the same in all cases.
 	"""
 
+	SAME_PAYLOAD = "payload"
+	SAME_SIGNAL_BITS = "signal_bits"
+
+	CHANGE_DETECTION = SAME_PAYLOAD
+
 	"""
 	The constructor will accept a callback that will be called by the parser
 	when it correctly parsed a CAN message. This callback will receive a CAN
-	event dictionary, containing the signal name and the converted value.
+	Event, containing the signal name and the converted value.
 	Constructor will also load the configuration from the file and will fire
 	an exception if there is an error in it.
+	change_detection defaults to CHANGE_DETECTION, see above.
 	"""
-	def __init__(self,callback,conf_file="can.json"):
+	def __init__(self,callback,conf_file="can.json" \
+		,change_detection=CHANGE_DETECTION):
 		ThreadedParser.__init__(self, callback)
+		self._change_detection = change_detection
 		self._configuration = { 'messages' : {} }
+		self._decoders = {}
 		self.load_configuration_from_file(conf_file)
 		
 	"""
@@ -37,6 +60,30 @@ class CANParser(ThreadedParser):
 	def get_requested_ids(self):
 		return self._configuration['messages'].keys()
 
+	"""
+	Returns the checked configuration in use, which can be passed to the
+	reload_configuration() of another parser
+	"""
+	def get_configuration(self):
+		return self._configuration
+
+	"""
+	Returns a dictionary mapping the CAN ID of every configured message to
+	its MessageDecoder. See BatchDecoder
+	"""
+	def get_decoders(self):
+		return self._decoders
+
+	"""
+	Returns a dictionary mapping the generic name of the signals with states
+	to the number of notified raw values that had no state
+	"""
+	def get_unmapped_states(self):
+		return dict((signal.generic_name, signal.unmapped) \
+			for decoder in self._decoders.values() \
+			for signal in decoder.signals \
+			if signal.states is not None)
+
 	"""
 	Returns a dictionary containing the configured can messages and their
 	dynamics. example:
@@ -59,94 +106,97 @@ class CANParser(ThreadedParser):
 	The main parsing method will use the informations configured by the user
 	into the can.json file, which is similar to the OpenXC firmware
 	configuration file.
+	Every configured message is compiled by _conf_check() into a
+	MessageDecoder, so the payload is converted to an integer once per frame
+	and the signals are extracted with their precomputed shift and mask.
 	See:
 		_conf_check() method
+		MessageDecoder and SignalDecoder classes
 		can.json.example
 		http://vi-firmware.openxcplatform.com/en/latest/config/config.html
 	"""
 	def _parse(self, element):
-		can_id = element['id']
-		if can_id in self._configuration['messages'].keys():
-			#pdb.set_trace()
-			can_value_as_string = element['data']
-			for signal in self._configuration['messages'][can_id]['signals']:
-				now = time.time()
-				sig_conf = self._configuration['messages'][can_id]['signals'][signal]
-				if sig_conf['raw'] == False:
-					sig_value = self._get_signal_value_from_can_message( \
-						can_value_as_string \
-						,sig_conf['bit_start'] \
-						,sig_conf['bit_size'])
-					
-					clear_to_notify = False
+		decoder = self._decoders.get(element['id'])
+		if decoder is None:
+			return
+
+		can_value_as_string = element['data']
+		if decoder.raw: # This is a RAW message, just send it back as is
+			raw_data = can_value_as_string
+			if isinstance(raw_data, bytearray):
+				raw_data = "0x"+binascii.hexlify(raw_data)
+			self._callback(Event('CAN', hex(element['id']), None, {
+				'id' : hex(element['id']),
+				'data' : raw_data
+				}))
+			if not decoder.signals:
+				return
+
+		# payload is what is compared with the last payload of the message, in
+		# order to tell if the signals have to be extracted again
+		payload = None
+		changed = True
+		if self._change_detection == CANParser.SAME_PAYLOAD:
+			payload = can_value_as_string
+			changed = payload != decoder.last_payload
+			if changed:
+				value, bit_length = payload_to_long(can_value_as_string)
+		else:
+			value, bit_length = payload_to_long(can_value_as_string)
+			if self._change_detection == CANParser.SAME_SIGNAL_BITS:
+				payload = (value & decoder.signal_bits(bit_length), bit_length)
+				changed = payload != decoder.last_payload
+
+		now = time.time()
+		for signal in decoder.signals:
+			if changed:
+				sig_value = (value >> (bit_length - signal.end)) & signal.mask
+				signal.value = sig_value
+			else:
+				sig_value = signal.value
+
+			clear_to_notify = False
 
-					if sig_conf['max_frequency'] == 0:
-						if sig_conf['send_same'] is True:
+			if signal.max_frequency == 0:
+				if signal.send_same is True:
+					clear_to_notify = True
+				else:
+					if sig_value != signal.last_value:
+						clear_to_notify = True
+
+			else: # max_frequency != 0
+				if signal.force_send_changed == True \
+				and sig_value != signal.last_value:
+					clear_to_notify = True
+				else:
+					if now > signal.last_change_ts + signal.min_period:
+						if signal.send_same == True:
 							clear_to_notify = True
 						else:
-							if sig_value != sig_conf['last_value']:
+							if sig_value != signal.last_value:
 								clear_to_notify = True
-					
-					else: # max_frequency != 0
-						if sig_conf['force_send_changed'] == True \
-						and sig_value != sig_conf['last_value']:
-							clear_to_notify = True
-						else:
-							if now > \
-							sig_conf['last_change_ts'] + \
-							1.0/sig_conf['max_frequency']:
-								if sig_conf['send_same'] == True:
-									clear_to_notify = True
-								else:
-									if sig_value != sig_conf['last_value']:
-										clear_to_notify = True
-
-					if clear_to_notify is True:
-						final_value = None
-
-						if 'states' in sig_conf:
-							for k, v in sig_conf['states'].iteritems():
-								if sig_value in v:
-									final_value = k
-									break;
-						else:
-							final_value = sig_value \
-								* sig_conf['factor'] \
-								+ sig_conf['offset']
-						
-						self._callback(	\
-							{'name' : sig_conf['generic_name'] \
-							, 'value' : final_value})
-
-						sig_conf['last_value'] = sig_value
-						sig_conf['last_change_ts'] = now
-
-				else: # This is a RAW message, just send it back as is
-					self._callback({
-						'name' : hex(element['id']),
-						'id' : hex(element['id']),
-						'data' : element['data']
-						})	
 
-	"""
-	Used to obtain the value of a signal inside a can message.
-	Example: You have the message 0x0010000000000000 and you want to get
-	the second byte multiplied by 0.5 and with an offset of 4:
-	You will have bit_pos=8, bit_size=8, offset=4 and factor=0.5, so you will
-	obtain:
-		0x0010000000000000 -->
-		--bit_pos=8--> 0x10000000000000 -->
-		--bit_size=8--> 0x10 -->
-		--factor=0.5--> 0x08 -->
-		--offset=4--> 0x0c --> 12
-	"""
-	def _get_signal_value_from_can_message( \
-			self,value_as_string,bit_pos,bit_size,offset=0,factor=1):
-		value_bit_length = (len(value_as_string)-2)*4
-		rshift = value_bit_length - bit_pos - bit_size
-		mask = long((1<<bit_size)-1)
-		value = long(value_as_string,16)
-		return long((((value >> rshift) & mask) * factor) + offset)
+			if clear_to_notify is True:
+				final_value = signal.convert(sig_value)
+				if final_value is None:
+					# A raw value without a state is notified along with the
+					# raw value, so that it can be told from a missing value
+					signal.unmapped += 1
+					self._callback(Event('CAN' \
+						, signal.generic_name \
+						, None \
+						, { 'raw_value' : sig_value }))
+				else:
+					self._callback(Event('CAN' \
+						, signal.generic_name \
+						, final_value))
+
+				signal.last_value = sig_value
+				signal.last_change_ts = now
+
+		# Only once all the signals have been extracted, so that a payload
+		# failing halfway is extracted again next time
+		decoder.last_payload = payload
 
 	"""
 	This method load the configuration file and pass it to the _conf_check()
@@ -159,13 +209,68 @@ class CANParser(ThreadedParser):
 		with open(configuration_file) as json_data:
 			conf_dict = json.load(json_data)
 			if self._conf_check(conf_dict):
-				self._configuration = conf_dict
+				self._set_configuration(conf_dict)
 			else:
 				print "Configuration error! TODO: Add log"
 			json_data.close()
 
 		return True
 
+	"""
+	Reads a configuration file and checks it. Returns the checked
+	configuration, to be passed to reload_configuration(), or None if it
+	cannot be read or it is not valid
+	"""
+	def read_configuration(self, configuration_file):
+		try:
+			with open(configuration_file) as json_data:
+				conf_dict = json.load(json_data)
+		except (IOError, ValueError) as e:
+			# TODO: Good log please
+			print "Cannot reload the CAN configuration: "+str(e)
+			return None
+
+		if not self._conf_check(conf_dict):
+			print "Configuration error! TODO: Add log"
+			return None
+		return conf_dict
+
+	"""
+	Loads a new version of the configuration while the parser is running,
+	given either as a file name or as a configuration already returned by
+	read_configuration(), which is not modified and can be shared by several
+	parsers. If the file cannot be read or it is not valid, the current
+	configuration is kept and False is returned.
+	"""
+	def reload_configuration(self, configuration):
+		if isinstance(configuration, basestring):
+			configuration = self.read_configuration(configuration)
+			if configuration is None:
+				return False
+
+		self._set_configuration(configuration)
+		return True
+
+	"""
+	Replaces the configuration and the decoders with the ones of a checked
+	configuration. The decoders of the messages whose configuration did not
+	change are kept, along with the state of their notifications, the others
+	are compiled from the configuration.
+	The decoders are swapped with a single assignment, so _parse() goes on
+	with either the old or the new ones.
+	"""
+	def _set_configuration(self, conf_dict):
+		messages = self._configuration['messages']
+		decoders = {}
+		for can_id, message in conf_dict['messages'].items():
+			if can_id in self._decoders and messages.get(can_id) == message:
+				decoders[can_id] = self._decoders[can_id]
+			else:
+				decoders[can_id] = MessageDecoder(can_id,message)
+
+		self._configuration = conf_dict
+		self._decoders = decoders
+
 	"""
 	This method will take the configuration json obtained from the 
 	configuration file, will parse it looking for errors and will enrich it
@@ -217,6 +322,10 @@ class CANParser(ThreadedParser):
 	detailed informations on what the keywords do here:
 		http://vi-firmware.openxcplatform.com/en/latest/config/config.html
 	Please see also the file can.json.example
+
+	Finally every message is compiled into a MessageDecoder, to check that
+	it can be: the decoders actually used are compiled by every parser
+	from the checked configuration, see _set_configuration().
 	"""
 	def _conf_check(self,configuration):
 		try:
@@ -278,6 +387,8 @@ class CANParser(ThreadedParser):
 						configuration['messages'][can_id]['force_send_changed'] = msg_force_send_changed
 
 			configuration['messages'] = {long(k,16):v for k,v in configuration['messages'].items()}
+			for can_id, message in configuration['messages'].items():
+				MessageDecoder(can_id,message)
 			return True
 
 		except Exception as e:
@@ -0,0 +1,237 @@
+"""
+This module contains a pool of CAN parsers, used to spread the parsing of
+CAN messages over several threads or processes
+"""
+
+__author__ = "Dario Fiumicello"
+__email__ = "dario.fiumicello@gmail.com"
+
+from .canparser import CANParser
+from utils import join_all
+import multiprocessing
+import threading
+
+class CANParserPool():
+	"""
+	CANParserPool is a drop-in replacement for the CANParser class, spreading
+	the parsing over N workers. Each CAN ID is always sent to the same worker
+	(the one with index CAN_ID % N), so the per-signal state (last value, last
+	notification time) of every message is only touched by one worker and no
+	lock is needed.
+
+	Workers are CANParser threads by default. Since threads cannot parse in
+	parallel because of the GIL, workers can also be processes: frames are
+	then parsed in the child processes and the resulting events are sent back
+	to a thread of the main process, which calls the callback.
+
+	Worker processes are forked, Python 2 having no other way to start them,
+	when the pool is built. A process forked while another thread holds a
+	lock (e.g. of a queue or of the logging module) would wait for it
+	forever, so a multiprocess pool must be built before any other thread is
+	started. The pool itself starts its threads after forking the workers.
+	"""
+
+	DEFAULT_WORKERS = 4
+
+	def __init__(self,callback,conf_file="can.json",workers=DEFAULT_WORKERS \
+		,multiprocess=False):
+		self._callback = callback
+		self._results = None
+		self._results_thread = None
+
+		if multiprocess:
+			self._results = multiprocessing.Queue()
+			self._workers = [CANParserProcess(self._results) \
+				for i in range(workers)]
+
+			# The configuration is still needed in this process for
+			# get_requested_ids() and get_configured_messages(), but this
+			# parser is never going to parse anything. Being a thread, it is
+			# built once the workers are forked, and they are sent its
+			# configuration.
+			self._conf_parser = CANParser(None,conf_file)
+			self._conf_parser.stop()
+			configuration = self._conf_parser.get_configuration()
+			for worker in self._workers:
+				worker.reload_configuration(configuration)
+
+			self._results_thread = threading.Thread(target=self._deliver)
+			self._results_thread.daemon = True
+			self._results_thread.start()
+		else:
+			self._workers = [CANParser(callback,conf_file) \
+				for i in range(workers)]
+			self._conf_parser = self._workers[0]
+
+	"""
+	See CANParser.get_requested_ids()
+	"""
+	def get_requested_ids(self):
+		return self._conf_parser.get_requested_ids()
+
+	"""
+	See CANParser.get_configured_messages()
+	"""
+	def get_configured_messages(self):
+		return self._conf_parser.get_configured_messages()
+
+	"""
+	Reloads the configuration in all the workers, see
+	CANParser.reload_configuration(). The file is read and checked once,
+	returning False if it cannot be read or it is not valid, and the checked
+	configuration is passed to every worker.
+	"""
+	def reload_configuration(self,conf_file):
+		configuration = self._conf_parser.read_configuration(conf_file)
+		if configuration is None:
+			return False
+		if self._conf_parser not in self._workers:
+			self._conf_parser.reload_configuration(configuration)
+		for worker in self._workers:
+			worker.reload_configuration(configuration)
+		return True
+
+	"""
+	Returns the queues of the worker threads. In multiprocess mode the
+	workers use multiprocessing queues, which are not bounded, and the list
+	is empty.
+	"""
+	def get_queues(self):
+		queues = []
+		if self._results is None:
+			for worker in self._workers:
+				queues.extend(worker.get_queues())
+		return queues
+
+	"""
+	Sets the LatencyMonitor of the worker threads, see
+	ThreadedParser.set_latency_monitor(). The events parsed by worker
+	processes are not traced.
+	"""
+	def set_latency_monitor(self,monitor):
+		if self._results is None:
+			for worker in self._workers:
+				worker.set_latency_monitor(monitor)
+
+	"""
+	Sends the element to the worker in charge of its CAN ID
+	"""
+	def enqueue(self,element):
+		self._worker_for(element).enqueue(element)
+
+	"""
+	Splits the elements by worker, keeping their order, and sends every
+	worker a single batch
+	"""
+	def enqueue_batch(self,elements):
+		n_workers = len(self._workers)
+		batches = [[] for i in range(n_workers)]
+		for element in elements:
+			batches[element['id'] % n_workers].append(element)
+		for worker, batch in zip(self._workers, batches):
+			if batch:
+				worker.enqueue_batch(batch)
+
+	"""
+	Gracefully stops all the workers
+	"""
+	def stop(self):
+		for worker in self._workers:
+			worker.stop()
+		if self._results is not None:
+			self._results.put(None)
+
+	"""
+	Waits for all the workers to terminate, for at most timeout seconds
+	overall. See utils.join_all()
+	"""
+	def join(self,timeout=None):
+		join_all(self._threads(),timeout)
+
+	def is_alive(self):
+		return any(thread.is_alive() for thread in self._threads())
+
+	def _threads(self):
+		threads = list(self._workers)
+		if self._results_thread is not None:
+			threads.append(self._results_thread)
+		return threads
+
+	def _worker_for(self,element):
+		return self._workers[element['id'] % len(self._workers)]
+
+	"""
+	Multiprocess mode only: gets the events parsed by the worker processes
+	and passes them to the callback
+	"""
+	def _deliver(self):
+		while True:
+			events = self._results.get()
+			if events is None:
+				break
+			for event in events:
+				try:
+					self._callback(event)
+				except Exception as e:
+					# TODO: Good log please
+					print "Exception in CANParserPool callback: "+str(e)
+
+
+class CANParserProcess(multiprocessing.Process):
+	"""
+	A worker process of the CANParserPool. It is sent the configuration
+	checked by the pool, see CANParser.read_configuration(), and parses every
+	batch of frames it receives, sending back all the resulting events of
+	the batch at once.
+	"""
+	def __init__(self,results):
+		multiprocessing.Process.__init__(self)
+		self.daemon = True
+		self._results = results
+		self._q = multiprocessing.Queue()
+		self.start()
+
+	def enqueue(self,element):
+		self._q.put([element])
+
+	def enqueue_batch(self,elements):
+		self._q.put(elements)
+
+	def stop(self):
+		self._q.put(None)
+
+	"""
+	The checked configuration, see CANParser.read_configuration(), is sent
+	to the child process, which reloads it between two batches
+	"""
+	def reload_configuration(self,configuration):
+		self._q.put(configuration)
+
+	"""
+	Runs in the child process. The parser thread is not needed here, frames
+	are parsed synchronously as soon as they are received. The configuration
+	is the first thing received.
+	"""
+	def run(self):
+		events = []
+		parser = CANParser(events.append,None)
+		parser.stop()
+
+		while True:
+			elements = self._q.get()
+			if elements is None:
+				break
+			if isinstance(elements, dict):
+				parser.reload_configuration(elements)
+				continue
+
+			for element in elements:
+				try:
+					parser._parse(element)
+				except Exception as e:
+					# TODO: Good log please
+					print "Exception in CANParserProcess: "+str(e)
+
+			if events:
+				self._results.put(list(events))
+				del events[:]
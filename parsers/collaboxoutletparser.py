@@ -44,7 +44,10 @@ class CollaboxOutletParser():
 					message['name'] : message['value']
 				}
 			elif message['type'] == 'CAN':
-				if {'name','value'}.issubset(message):
+				# A raw value without a state has a None value and its
+				# raw_value, it is published with a null value
+				if {'name','value'}.issubset(message) \
+					or 'raw_value' in message:
 					outlet_message['data'] = {
 						message['name'] : message['value']
 					}
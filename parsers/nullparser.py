@@ -3,6 +3,8 @@ import json
 class NullParser():
 	def parse(self,event):
 		try:
+			if hasattr(event, 'to_dict'):
+				event = event.to_dict()
 			return json.dumps(event)
 		except:
 			return None
\ No newline at end of file
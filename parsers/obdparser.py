@@ -7,6 +7,7 @@ __author__ = "Dario Fiumicello"
 __email__ = "dario.fiumicello@gmail.com"
 
 from .threadedparser import ThreadedParser
+from eventmanager import Event
 import binascii
 import pdb
 
@@ -16,8 +17,8 @@ class OBDParser(ThreadedParser):
 	will convert it into an OBD event.
 
 	The element to be parsed must be a dictionary containing "id" and "data"
-	fields, where "id" is the OBD id and "data" is a string representation of
-	the 8 byte raw OBD message
+	fields, where "id" is the OBD id and "data" is either a string
+	representation of the 8 byte raw OBD message or the raw bytearray itself
 
 	TODO: Actually only the VIN is supported and there is no check on the ID
 	that is going to be parsed and on the element structure. Shame on me!
@@ -47,8 +48,14 @@ class OBDParser(ThreadedParser):
 		if 'data' not in element:
 			return
 		raw_response_string = element['data']
-		if raw_response_string.startswith("0x"):
+		if isinstance(raw_response_string, bytearray):
+			raw_data = raw_response_string
+		elif raw_response_string.startswith("0x"):
 			raw_data = bytearray.fromhex(raw_response_string[2:])
+		else:
+			raw_data = None
+
+		if raw_data is not None:
 			raw_message = None
 			
 			if raw_data[0] & 0xF0 == OBDParser.OBD_SINGLE_FRAME:
@@ -60,11 +67,11 @@ class OBDParser(ThreadedParser):
 					if pid == 0x0d: # Speed
 						speed = raw_data[3]
 						self._callback( \
-							{'name' : 'Speed', 'value' : speed })
+							Event('OBD', 'Speed', speed))
 					elif pid == 0x2f: # Fuel Tank Level
 						speed = raw_data[3]*100/255
 						self._callback( \
-							{'name' : 'FuelTankLevel', 'value' : speed })
+							Event('OBD', 'FuelTankLevel', speed))
 
 			# TODO: vi firmware doesn't fully support multiframes directly.
 			# Actually it just recognizes if a frame is the start of a
@@ -94,7 +101,7 @@ class OBDParser(ThreadedParser):
 					if raw_message is not None:
 						# The VIN has been reassembled, let's fire the event
 						self._multiframe_handler = None
-						reply = {'name' : 'VIN' }
+						reply = Event('OBD', 'VIN')
 						try:
 							reply['value'] = raw_message.decode()
 						except UnicodeDecodeError:
@@ -5,7 +5,7 @@ This module exports an abstract threaded implementation of a parser
 __author__ = "Dario Fiumicello"
 __email__ = "dario.fiumicello@gmail.com"
 
-import Queue
+from utils import BoundedQueue
 import threading
 
 import pdb
@@ -21,51 +21,121 @@ class ThreadedParser(threading.Thread):
 
 	This way, who calls the enqueue() method will not be blocked during
 	the parsing.
+
+	The FIFO holds at most QUEUE_SIZE batches, as passed to enqueue_batch()
+	(a batch is what the VI delivered at once, usually a few frames), not
+	QUEUE_SIZE elements. When it is full the oldest batch is dropped by
+	default, since fresh data is worth more than old data; subclasses can
+	override QUEUE_SIZE and QUEUE_POLICY, or they can be passed to the
+	constructor. See BoundedQueue. The drops of the queue count the dropped
+	elements, not the batches.
+
+	When a LatencyMonitor is set, every batch is queued together with its
+	ingest timestamp and the events produced by the parser get a trace with
+	the ingest, parse start and parse end timestamps.
 	"""
+
+	QUEUE_SIZE = 1000
+	QUEUE_POLICY = BoundedQueue.DROP_OLDEST
 	
-	def __init__(self, callback=None):
+	def __init__(self, callback=None, queue_size=None, queue_policy=None):
 		threading.Thread.__init__(self)
 		self.daemon = True
 		self._can_run = True
 		self._callback = callback
-		self._q = Queue.Queue() 
+		self._latency_monitor = None
+		if queue_size is None:
+			queue_size = self.QUEUE_SIZE
+		self._q = BoundedQueue(queue_size \
+			,queue_policy or self.QUEUE_POLICY \
+			,name=self.__class__.__name__ \
+			,size=lambda batch: len(batch[1]))
 		self.start()
 
+	"""
+	Returns the list of the queues of this parser, so that their drops can
+	be watched. See EventManager.watch_queues()
+	"""
+	def get_queues(self):
+		return [self._q]
+
+	"""
+	Sets the LatencyMonitor used to trace the events produced by this parser,
+	None to stop tracing them
+	"""
+	def set_latency_monitor(self,monitor):
+		self._latency_monitor = monitor
+		if monitor is not None:
+			monitor.watch_queues(self.get_queues())
+
 	"""
 	This method allows to enqueue the element that has to be parsed. The
 	parser thread is going to get this element from the FIFO and then parse
 	it asynchronously.
 	"""
 	def enqueue(self,element):
-		self._q.put(element)
+		self.enqueue_batch([element])
 
 	"""
-	The main thread will simply block on the queue waiting for an element to
-	be obtained. As soon as a new element arrives it will be passed to the
-	_parse() method, that must be overridden by subclasses.
+	Same as enqueue() but for a list of elements. The whole list is put on
+	the FIFO at once, so the queue locking is paid once per batch instead of
+	once per element.
+	"""
+	def enqueue_batch(self,elements):
+		monitor = self._latency_monitor
+		self._q.put((monitor.now() if monitor is not None else None, elements))
+
+	"""
+	The main thread will simply block on the queue waiting for a batch of
+	elements to be obtained. As soon as a new batch arrives each element will
+	be passed to the _parse() method, that must be overridden by subclasses.
+	A None is put on the queue by stop() to wake the thread up.
 	"""
 	def run(self):
 		while self._can_run:
-			try:
-  				element = self._q.get(True,5)
-				if element is not None:
-					self._parse(element)
+			batch = self._q.get()
+			if batch is None:
+				continue
 
-			except Queue.Empty:
-				pass
+			ingest, elements = batch
+			monitor = self._latency_monitor
+			if ingest is not None and monitor is not None:
+				self._parse_traced(elements,ingest,monitor)
+			else:
+				self._parse_all(elements)
+
+	def _parse_all(self,elements):
+		for element in elements:
+			try:
+				self._parse(element)
 
 			except Exception as e:
 				# TODO: Good log please
 				print "Exception in ThreadedParser or subclass: "+str(e)
 
-			finally:
-				pass
+	"""
+	Same as _parse_all(), the callback being wrapped in order to add the
+	trace to the events
+	"""
+	def _parse_traced(self,elements,ingest,monitor):
+		callback = self._callback
+		parse_start = monitor.now()
+		def traced_callback(event):
+			event.trace = [ingest, parse_start, monitor.now()]
+			callback(event)
+
+		self._callback = traced_callback
+		try:
+			self._parse_all(elements)
+		finally:
+			self._callback = callback
 
 	"""
 	Gracefully stops the parser thread
 	"""
 	def stop(self):
 		self._can_run = False
+		self._q.wake()
 
 	"""
 	This method has to be overridden by subclasses in order to really parse
@@ -8,7 +8,7 @@ class VTPocParser():
 				"lon": str(event['longitude']),
 				"lat": str(event['latitude']),
 				"groupId":"222"})
-		elif event['type'] == 'SYS':
+		elif event['type'] == 'SYS' and 'cpu_load' in event:
 			return json.dumps({
 				"vin":"vin00",
 				"cpu_load": str(event['cpu_load']),
@@ -33,6 +33,11 @@ class CANWriter():
 	For every CAN id the user wants to write for, it has to specify both
 	the 8 byte data and the frequency, as shown in the example.
 	"""
+
+	# Subscription to the EventManager
+	EVENT_TYPES = ('VI',)
+	EVENT_NAMES = ('connection',)
+
 	def __init__(self,event_manager,conf_file="wcan.json"):
 		self._w_vi = None
 		self._write_ids = []
@@ -142,6 +147,12 @@ class CANWriter():
 			self._w_vi = None
   			self._event_manager.new_vi_error_event(e,fired_by="CANWriter")
 
+	"""
+	Stops the writing and the scheduler thread
+	"""
+	def stop(self):
+		self._scheduler.kill()
+
   	"""
   	Let's clean the scheduler in order to avoid problems after destruction
   	"""
@@ -51,6 +51,11 @@ class FilterConfigurator(threading.Thread):
 	  http://vi-firmware.openxcplatform.com/en/latest/config/raw-examples.html
 	  CANParser class
 	"""
+
+	# Subscription to the EventManager
+	EVENT_TYPES = ('VI',)
+	EVENT_NAMES = ('connection',)
+
 	def __init__(self,event_manager,messages):
 		threading.Thread.__init__(self)
 		self.daemon = True
@@ -60,42 +65,80 @@ class FilterConfigurator(threading.Thread):
 		self._connect_event.clear()
 		self._vi = None
 		self._messages = messages
+		# CAN ID -> (max_frequency, force_send_changed) of the filters set on
+		# _applied_vi. Both are only touched by the thread, which starts over
+		# when it finds a different VI connected
+		self._applied = {}
+		self._applied_vi = None
 		self.start()
 	
 	"""
 	The filter configurator will run for ever, waiting for a VI to connect.
-	As soon as VI is connected it will set all the required filters.
+	As soon as VI is connected it will set all the required filters. When
+	the messages change (see set_messages()) only the filters that are
+	missing or different on the connected VI are set.
 	"""
 	def run(self):
 		while self._can_run:
 			try:
-  				connected = self._connect_event.wait(2)
-  				if connected is True:
-  					for can_id in self._messages:
-  						if not self._vi.filter_message(1 \
-  							, can_id \
-  							, max_frequency=\
-  								self._messages[can_id]['max_frequency'] \
-  							, force_send_changed=\
-  								self._messages[can_id]['force_send_changed']):
-  							self._event_manager.new_vi_error_event( \
-  								FilterConfiguratorException( \
-  									"Cannot set filter for id "+str(can_id)) \
-  								,fired_by="FilterConfigurator")
-  							break
-  			
-  			except Exception as e: 
-  				self._event_manager.new_vi_error_event( \
-  					e,fired_by="FilterConfigurator")
-
-  			finally:
-  				self._connect_event.clear()
+				connected = self._connect_event.wait()
+				# Cleared before setting the filters, so that messages changed
+				# in the meantime wake the thread up again
+				self._connect_event.clear()
+				if self._can_run and connected is True:
+					self._set_filters()
+
+			except Exception as e: 
+				self._event_manager.new_vi_error_event( \
+					e,fired_by="FilterConfigurator")
+
+	def _set_filters(self):
+		vi = self._vi
+		if vi is None:
+			return
+
+		if vi is not self._applied_vi:
+			self._applied = {}
+			self._applied_vi = vi
+
+		messages = self._messages
+		applied = self._applied
+		for can_id in messages:
+			dynamics = (messages[can_id]['max_frequency'] \
+				,messages[can_id]['force_send_changed'])
+			if applied.get(can_id) == dynamics:
+				continue
+
+			if not vi.filter_message(1 \
+				, can_id \
+				, max_frequency=dynamics[0] \
+				, force_send_changed=dynamics[1]):
+				self._event_manager.new_vi_error_event( \
+					FilterConfiguratorException( \
+						"Cannot set filter for id "+str(can_id)) \
+					,fired_by="FilterConfigurator")
+				break
+			applied[can_id] = dynamics
+
+	"""
+	Replaces the messages to be filtered, e.g. when the CAN configuration is
+	reloaded. If a VI is connected the new or changed filters are set right
+	away. The VI cannot remove a filter, so the frames of the messages that
+	are not configured anymore keep being received, and are just not routed
+	to any parser (see FrameRouter).
+	"""
+	def set_messages(self,messages):
+		self._messages = messages
+		if self._vi is not None:
+			self._connect_event.set()
 
   	"""
-  	Gracefully stop the filter configurator
+  	Gracefully stop the filter configurator. The connection event is set in
+  	order to wake the thread up.
   	"""
 	def stop(self):
 		self._can_run = False
+		self._connect_event.set()
 
 	"""
 	The filter configurator will listen for the connected and disconnected
@@ -109,4 +152,5 @@ class FilterConfigurator(threading.Thread):
 				self._vi = event['vi']
 				self._connect_event.set()
 			elif event['value'] == 'disconnected':
+				self._vi = None
 				self._connect_event.clear()
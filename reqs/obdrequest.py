@@ -21,6 +21,9 @@ class OBDRequest(threading.Thread):
 
 	OBD_BROADCAST_PID = 0x7df
 
+	# Subscription to the EventManager
+	EVENT_TYPES = ('VI','OBD')
+
 	"""
 	Subclasses has to initialize OBDRequest with the 
 	OBD mode and pids and an event_name to be used as the "name" value for the
@@ -54,16 +57,19 @@ class OBDRequest(threading.Thread):
 	"""
 	def run(self):
 		while self._can_run:
-			self._can_execute = self._execute_event.wait(2)
-	   		if self._can_execute is True:
+			self._can_execute = self._execute_event.wait()
+	   		if self._can_run and self._can_execute is True:
 	   			if not self._execute():
 	   				self._execute_event.clear()
 
   	"""
-  	When called it will gracefully stop the OBDRequest thread
+  	When called it will gracefully stop the OBDRequest thread. The events
+  	are set in order to wake the thread up if it is waiting on them.
   	"""
 	def stop(self):
 		self._can_run = False
+		self._response_event.set()
+		self._execute_event.set()
 
 	"""
 	This method is called by the event manager when a new event occur.
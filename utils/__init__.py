@@ -3,3 +3,8 @@ from .viwatchdog import VIWatchdog
 from .systimesource import SYSTimesource
 from .btcache import BTCache
 from .periodictimer import PeriodicTimer
+from .framerouter import FrameRouter
+from .boundedqueue import BoundedQueue
+from .threadjoin import join_all
+from .latencymonitor import LatencyMonitor, LatencyHistogram
+from .configwatcher import ConfigWatcher
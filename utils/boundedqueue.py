@@ -0,0 +1,186 @@
+"""
+This module contains a FIFO queue with a limited capacity and a selectable
+policy for when it is full
+"""
+
+__author__ 	= "Dario Fiumicello"
+__email__ 	= "dario.fiumicello@gmail.com"
+
+import Queue
+import collections
+import time
+
+class BoundedQueue(Queue.Queue):
+	"""
+	A BoundedQueue is a Queue.Queue that cannot grow over "maxsize" elements
+	(0 means unbounded, as usual). What happens when a put() finds the queue
+	full depends on the policy:
+	- BLOCK: the producer waits until there is room, as in Queue.Queue.
+	- DROP_OLDEST: the oldest element is dropped to make room for the new one.
+	- DROP_NEWEST: the new element is dropped.
+	- COALESCE: if an element with the same key (by default the type and the
+	  name of an event) is already waiting, it is replaced by the new one,
+	  keeping its position. Otherwise the oldest element is dropped.
+
+	Every dropped or replaced element is counted in "dropped", as 1 or, if a
+	size function is given, as size(element), e.g. the number of frames of
+	a queued batch of frames. The name is only used to tell queues apart
+	when reporting the drops.
+	"""
+
+	BLOCK = "block"
+	DROP_OLDEST = "drop_oldest"
+	DROP_NEWEST = "drop_newest"
+	COALESCE = "coalesce"
+
+	POLICIES = (BLOCK, DROP_OLDEST, DROP_NEWEST, COALESCE)
+
+	def __init__(self,maxsize=0,policy=BLOCK,name=None,key=None,size=None):
+		if policy not in self.POLICIES:
+			raise ValueError("Unknown queue policy: "+str(policy))
+		self.policy = policy
+		self.name = name
+		self.dropped = 0
+		self._key = key or event_key
+		self._size = size
+		Queue.Queue.__init__(self,maxsize)
+
+	"""
+	Puts the item in the queue, applying the policy if the queue is full.
+	Only the BLOCK policy takes the block and timeout arguments into account,
+	the others never block.
+	"""
+	def put(self,item,block=True,timeout=None):
+		if self.policy == self.BLOCK:
+			return Queue.Queue.put(self,item,block,timeout)
+
+		with self.not_full:
+			if 0 < self.maxsize <= self._qsize():
+				if not self._overflow(item):
+					return
+			self._put(item)
+			self.unfinished_tasks += 1
+			self.not_empty.notify()
+
+	"""
+	Same as put() for a list of items, but the queue is locked only once.
+	With the BLOCK policy the items are just put one by one.
+	"""
+	def put_many(self,items):
+		if self.policy == self.BLOCK:
+			for item in items:
+				Queue.Queue.put(self,item)
+			return
+
+		with self.not_full:
+			for item in items:
+				if 0 < self.maxsize <= self._qsize():
+					if not self._overflow(item):
+						continue
+				self._put(item)
+				self.unfinished_tasks += 1
+			self.not_empty.notify(len(items))
+
+	"""
+	Blocks until an item is available, then returns a list with up to
+	max_items items. If less items are queued, it waits for more for at most
+	max_wait seconds since the first one was got.
+	"""
+	def get_batch(self,max_items,max_wait=0):
+		items = [self.get()]
+		deadline = time.time() + max_wait
+		with self.not_empty:
+			while len(items) < max_items:
+				if self._qsize() == 0:
+					remaining = deadline - time.time()
+					if remaining <= 0:
+						break
+					self.not_empty.wait(remaining)
+					continue
+				items.append(self._get())
+			if len(items) > 1:
+				self.not_full.notify(len(items) - 1)
+		return items
+
+	"""
+	Puts a None in the queue, whatever the policy and the free room, in order
+	to wake up a thread blocked on get(), e.g. to make it notice it has been
+	stopped
+	"""
+	def wake(self):
+		with self.not_full:
+			self._put(None)
+			self.unfinished_tasks += 1
+			self.not_empty.notify()
+
+	"""
+	Called with the queue full and locked. Makes room for the item or drops
+	it, returns True if the item still has to be put in the queue.
+	"""
+	def _overflow(self,item):
+		if self.policy == self.DROP_NEWEST:
+			self._count_dropped(item)
+			return False
+
+		if self.policy == self.COALESCE:
+			key = self._key(item)
+			entry = self._latest.get(key) if key is not None else None
+			if entry is not None:
+				self._count_dropped(entry[1])
+				entry[1] = item
+				return False
+
+		self._count_dropped(self._get())
+		self.unfinished_tasks -= 1
+		return True
+
+	def _count_dropped(self,item):
+		if self._size is None or item is None:
+			self.dropped += 1
+		else:
+			self.dropped += self._size(item)
+
+	# Elements are stored as [key, item] entries, so that the COALESCE policy
+	# can find and replace the latest waiting element with a given key
+	# without scanning the queue
+	def _init(self,maxsize):
+		self.queue = collections.deque()
+		self._latest = {}
+
+	def _put(self,item):
+		key = None
+		if self.policy == self.COALESCE and item is not None:
+			key = self._key(item)
+		entry = [key, item]
+		self.queue.append(entry)
+		if key is not None:
+			self._latest[key] = entry
+
+	def _get(self):
+		entry = self.queue.popleft()
+		if entry[0] is not None and self._latest.get(entry[0]) is entry:
+			del self._latest[entry[0]]
+		return entry[1]
+
+"""
+Event types that are never coalesced: they are not measurements superseded
+by the next one, e.g. a VI connection is followed by a disconnection with
+the same name, and every log message counts
+"""
+UNCOALESCED_TYPES = frozenset(('VI', 'LOG'))
+
+"""
+The default coalescing key: elements are coalesced if they are measurement
+events with the same type and name. Anything else is never coalesced.
+"""
+def event_key(item):
+	if isinstance(item, dict):
+		name = item.get('name')
+		event_type = item.get('type')
+	else:
+		# Event objects, see eventmanager.Event
+		name = getattr(item, 'name', None)
+		event_type = getattr(item, 'type', None)
+	if name is None or event_type in UNCOALESCED_TYPES:
+		return None
+	return (event_type, name)
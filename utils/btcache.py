@@ -1,12 +1,23 @@
 """
-The class contained in this module provides the persistent storage of 
+The class contained in this module provides the persistent storage of
 the last Bluetooth device the application connected to
 """
 
 __author__ 	= "Dario Fiumicello"
 __email__ 	= "dario.fiumicello@gmail.com"
 
+import json
+
 class BTCache():
+	"""
+	Besides the address, the cache stores what has been learnt about the
+	device at that address: its payload format and the firmware version and
+	device id it reported. This way a reconnection to the same device can
+	skip the payload format detection and the command round-trips.
+
+	The cache file is a JSON object. A file containing just the address, as
+	written by previous versions, is still accepted.
+	"""
 	def __init__(self \
 		,filename="/tmp/carlistener_bt.cache"):
 		self._filename = filename;
@@ -16,32 +27,102 @@ class BTCache():
 	occurred
 	"""
 	def get_address(self):
-		address = None
-		file = None
-		try:
-			file = open(self._filename, "r")
-			address = file.read()
-			if address == '':
-				address = None
-			file.close()
-		except IOError:
-			if file != None and file.is_open():
-				file.close()
+		address = self._load().get('address')
+		if address != None:
+			address = str(address)
 		return address
 
 	"""
 	Tries to write the address on file. Returns True if the write had success,
-	False otherwise
+	False otherwise. Whatever was cached about a different address is
+	discarded.
 	"""
 	def set_address(self,address):
+		cache = self._load()
+		if cache.get('address') != address:
+			cache = {}
+		if address != None:
+			cache['address'] = address
+		return self._store(cache)
+
+	"""
+	Gets the payload format ("json" or "protobuf") of the cached device.
+	Returns None if it is not known
+	"""
+	def get_payload_format(self):
+		return self._load().get('payload_format')
+
+	"""
+	Stores the payload format of the cached device. Returns True if the
+	write had success, False otherwise. If the format changed, the firmware
+	of the device probably did too, so its version and device id are
+	discarded.
+	"""
+	def set_payload_format(self,payload_format):
+		cache = self._load()
+		if cache.get('payload_format') != payload_format:
+			cache.pop('version', None)
+			cache.pop('device_id', None)
+		cache['payload_format'] = payload_format
+		return self._store(cache)
+
+	"""
+	Gets a (version, device_id) tuple for the cached device. Any of them is
+	None if it is not known
+	"""
+	def get_vi_info(self):
+		cache = self._load()
+		return (cache.get('version'), cache.get('device_id'))
+
+	"""
+	Stores the firmware version and the device id of the cached device. A
+	None, e.g. from a command that timed out, is not stored, so that it is
+	asked again next time. Returns True if the write had success, False
+	otherwise
+	"""
+	def set_vi_info(self,version,device_id):
+		cache = self._load()
+		if version is not None:
+			cache['version'] = version
+		if device_id is not None:
+			cache['device_id'] = device_id
+		return self._store(cache)
+
+	"""
+	Discards the firmware version and the device id of the cached device,
+	e.g. after a connection failure. Returns True if the write had success,
+	False otherwise
+	"""
+	def clear_vi_info(self):
+		cache = self._load()
+		cache.pop('version', None)
+		cache.pop('device_id', None)
+		return self._store(cache)
+
+	def _load(self):
+		cache = {}
+		file = None
+		try:
+			file = open(self._filename, "r")
+			content = file.read()
+			file.close()
+			if content.startswith('{'):
+				cache = json.loads(content)
+			elif content != '':
+				cache = { 'address' : content }
+		except (IOError, ValueError):
+			if file != None and not file.closed:
+				file.close()
+		return cache
+
+	def _store(self,cache):
 		file = None
 		try:
 			file = open(self._filename, "w")
-			if address != None:
-				file.write(address)
+			file.write(json.dumps(cache))
 			file.close()
 		except IOError:
-			if file != None and file.is_open():
+			if file != None and not file.closed:
 				file.close()
 			return False
 		return True
@@ -0,0 +1,63 @@
+"""
+This module contains a class that watches a configuration file for changes
+"""
+
+__author__ 	= "Dario Fiumicello"
+__email__ 	= "dario.fiumicello@gmail.com"
+
+import os
+import threading
+
+class ConfigWatcher(threading.Thread):
+	"""
+	A ConfigWatcher polls the modification time and the size of a file
+	every POLL_PERIOD_S seconds, and calls callback(path) when they change,
+	e.g. to reload a configuration file without restarting the program.
+
+	While the file is missing (e.g. while an editor replaces it) nothing is
+	called. A file saved in several writes may be seen half written, so the
+	callback has to check the file and keep the old configuration if it is
+	not valid: it will be called again at the next write.
+	"""
+
+	POLL_PERIOD_S = 2
+
+	def __init__(self,path,callback,period=POLL_PERIOD_S):
+		threading.Thread.__init__(self)
+		self.daemon = True
+		self._can_run = True
+		self._path = path
+		self._callback = callback
+		self._period = period
+		self._stop_event = threading.Event()
+		self._signature = self._get_signature()
+		self.start()
+
+	def run(self):
+		while self._can_run:
+			self._stop_event.wait(self._period)
+			if not self._can_run:
+				break
+
+			signature = self._get_signature()
+			if signature is not None and signature != self._signature:
+				self._signature = signature
+				try:
+					self._callback(self._path)
+				except Exception as e:
+					# TODO: Good log please
+					print "Exception in ConfigWatcher callback: "+str(e)
+
+	"""
+	Gracefully stops the watcher thread, waking it up
+	"""
+	def stop(self):
+		self._can_run = False
+		self._stop_event.set()
+
+	def _get_signature(self):
+		try:
+			stat = os.stat(self._path)
+		except OSError:
+			return None
+		return (stat.st_mtime, stat.st_size)
@@ -0,0 +1,100 @@
+"""
+This module contains a class that dispatches the received CAN frames to the
+parsers interested in them
+"""
+
+__author__ 	= "Dario Fiumicello"
+__email__ 	= "dario.fiumicello@gmail.com"
+
+class FrameRouter():
+	"""
+	The FrameRouter keeps a routing table built once at startup, mapping
+	every CAN ID to the destinations (usually parsers) of its frames. Routing
+	a frame is then a single dictionary lookup, however many IDs are
+	configured. The routes of a destination can be replaced with
+	set_routes() while frames are being routed.
+
+	A destination must provide the enqueue_batch(frames) method, see the
+	ThreadedParser class. The same CAN ID can be routed to any number of
+	destinations. If an ID must only go to one of them (e.g. to the CAN
+	parser rather than to the OBD one), the caller leaves it out of the
+	routes of the others.
+
+	Frames whose ID has no route are not forwarded but counted per ID in
+	the "unrouted_ids" dictionary, and in total in "unrouted_frames". They
+	are reported by the EventManager, see EventManager.watch_router().
+	"""
+	def __init__(self):
+		self._routes = {}
+		self.unrouted_frames = 0
+		self.unrouted_ids = {}
+
+	"""
+	Routes all the frames with the given CAN ID to the destination too
+	"""
+	def add_route(self,can_id,destination):
+		destinations = self._routes.get(can_id, ())
+		if destination not in destinations:
+			self._routes[can_id] = destinations + (destination,)
+
+	"""
+	Same as add_route() for a list of CAN IDs
+	"""
+	def add_routes(self,can_ids,destination):
+		for can_id in can_ids:
+			self.add_route(can_id,destination)
+
+	"""
+	Replaces all the routes to the destination with routes for the given CAN
+	IDs, e.g. when the configuration of a parser is reloaded. The new
+	routing table is swapped with a single assignment.
+	"""
+	def set_routes(self,can_ids,destination):
+		routes = {}
+		for can_id, destinations in self._routes.items():
+			destinations = tuple(d for d in destinations if d is not destination)
+			if destinations:
+				routes[can_id] = destinations
+		for can_id in can_ids:
+			destinations = routes.get(can_id, ())
+			if destination not in destinations:
+				routes[can_id] = destinations + (destination,)
+		self._routes = routes
+
+	"""
+	Returns the tuple of destinations for the given CAN ID
+	"""
+	def get_destinations(self,can_id):
+		return self._routes.get(can_id, ())
+
+	"""
+	Routes a list of frames. Frames are grouped by destination, so that every
+	destination gets a single batch containing all its frames in order of
+	arrival. Messages without an "id" (e.g. command responses) are ignored.
+	It can be directly used as the batch callback of a VI.
+	"""
+	def route(self,frames):
+		routes = self._routes
+		batches = {}
+		for frame in frames:
+			if 'id' not in frame:
+				continue
+
+			destinations = routes.get(frame['id'])
+			if destinations is None:
+				self._count_unrouted(frame['id'])
+				continue
+
+			for destination in destinations:
+				batch = batches.get(destination)
+				if batch is None:
+					batches[destination] = [frame]
+				else:
+					batch.append(frame)
+
+		for destination, batch in batches.items():
+			destination.enqueue_batch(batch)
+
+	def _count_unrouted(self,can_id):
+		self.unrouted_frames += 1
+		self.unrouted_ids[can_id] = self.unrouted_ids.get(can_id, 0) + 1
@@ -0,0 +1,212 @@
+"""
+This module contains the classes used to measure how long the events take
+to flow through the pipeline, from the reception of a CAN frame to its
+consumers
+"""
+
+__author__ 	= "Dario Fiumicello"
+__email__ 	= "dario.fiumicello@gmail.com"
+
+import threading
+import time
+
+# A monotonic clock when available (Python 3), the system clock otherwise
+clock = getattr(time, 'monotonic', time.time)
+
+class LatencyHistogram():
+	"""
+	A histogram of latencies in the style of HdrHistogram: values are counted
+	in buckets whose width grows with the value, so that every value from one
+	microsecond to hours is kept with the same relative precision
+	(1/SUB_BUCKETS, about 3%) in a small fixed-size list of counters.
+
+	Values below 2*SUB_BUCKETS microseconds have a bucket each. Above, every
+	power of two is split into SUB_BUCKETS buckets.
+
+	A histogram can be recorded by several threads (e.g. "consume" by all
+	the consumers) and read by another one, so it is guarded by a lock.
+	"""
+
+	SUB_BUCKETS = 32
+	# Enough buckets for 2^63 microseconds
+	BUCKETS = 60 * SUB_BUCKETS
+
+	def __init__(self,name=None):
+		self.name = name
+		self._lock = threading.Lock()
+		self.reset()
+
+	def reset(self):
+		with self._lock:
+			self.count = 0
+			self.total = 0.0
+			self.min = None
+			self.max = 0.0
+			self._counts = [0] * self.BUCKETS
+
+	"""
+	Records a latency, in seconds
+	"""
+	def record(self,latency):
+		if latency < 0:
+			latency = 0.0
+		microseconds = int(latency * 1000000)
+		shift = microseconds.bit_length() - 6
+		if shift <= 0:
+			index = microseconds
+		else:
+			index = (shift << 5) + (microseconds >> shift)
+
+		with self._lock:
+			self.count += 1
+			self.total += latency
+			if self.min is None or latency < self.min:
+				self.min = latency
+			if latency > self.max:
+				self.max = latency
+			self._counts[index] += 1
+
+	"""
+	Returns the latency, in seconds, below which the given percentage of the
+	recorded latencies are, or None if nothing was recorded
+	"""
+	def percentile(self,percent):
+		with self._lock:
+			return self._percentile(percent)
+
+	def _percentile(self,percent):
+		if self.count == 0:
+			return None
+		threshold = self.count * percent / 100.0
+		seen = 0
+		for index, count in enumerate(self._counts):
+			seen += count
+			if count > 0 and seen >= threshold:
+				return min(self._highest_value(index) / 1000000.0, self.max)
+		return self.max
+
+	"""
+	Returns the highest value, in microseconds, counted in the given bucket
+	"""
+	def _highest_value(self,index):
+		shift = (index >> 5) - 1
+		if shift <= 0:
+			return index
+		return ((index - (shift << 5) + 1) << shift) - 1
+
+	"""
+	Returns the statistics as a dictionary, with times in milliseconds
+	"""
+	def to_dict(self):
+		with self._lock:
+			stats = { 'count' : self.count }
+			if self.count > 0:
+				stats['mean_ms'] = 1000 * self.total / self.count
+				stats['min_ms'] = 1000 * self.min
+				stats['max_ms'] = 1000 * self.max
+				for percent in (50, 90, 99):
+					stats['p%d_ms' % percent] = \
+						1000 * self._percentile(percent)
+		return stats
+
+
+class LatencyMonitor():
+	"""
+	A LatencyMonitor collects the time the events take to go through the
+	stages of the pipeline. When it is given to the parsers and to the
+	EventManager through their set_latency_monitor() methods, the events
+	produced by the parsers carry a trace of clock() timestamps:
+	- ingest: the frame was received from the VI and queued to the parser
+	- parse start: the parser took the frame from its queue
+	- parse end: the parser produced the event
+	- dispatch: the EventManager took the event from its queue
+	- consume: a consumer finished consuming the event
+
+	The latency between two consecutive timestamps is recorded in the
+	histogram of a stage, see STAGES, and the whole latency in "total".
+	The "consume" and "total" stages are recorded once per consumer.
+
+	The depth of the watched queues is sampled when the statistics are
+	taken. Nothing is traced when no LatencyMonitor is set.
+	"""
+
+	STAGES = ('parser_queue', 'parse', 'manager_queue', 'consume', 'total')
+
+	def __init__(self):
+		self.histograms = dict((stage, LatencyHistogram(stage)) \
+			for stage in self.STAGES)
+		self._queues = []
+
+	"""
+	The clock used for the timestamps of the traces
+	"""
+	def now(self):
+		return clock()
+
+	"""
+	Adds the given BoundedQueues to the ones whose depth is reported
+	"""
+	def watch_queues(self,queues):
+		for queue in queues:
+			if queue not in self._queues:
+				self._queues.append(queue)
+
+	"""
+	Called by the EventManager when it takes a batch of events from its
+	queue: the dispatch timestamp is added to the traced events and the
+	latencies of the parser stages are recorded
+	"""
+	def dispatched(self,events,dispatch=None):
+		if dispatch is None:
+			dispatch = clock()
+		histograms = self.histograms
+		for event in events:
+			trace = event.trace
+			if trace is None or len(trace) != 3:
+				continue
+			ingest, parse_start, parse_end = trace
+			histograms['parser_queue'].record(parse_start - ingest)
+			histograms['parse'].record(parse_end - parse_start)
+			histograms['manager_queue'].record(dispatch - parse_end)
+			trace.append(dispatch)
+
+	"""
+	Called when a consumer has consumed the given events, after
+	dispatched()
+	"""
+	def consumed(self,events,end=None):
+		if end is None:
+			end = clock()
+		histograms = self.histograms
+		for event in events:
+			trace = event.trace
+			if trace is None or len(trace) != 4:
+				continue
+			histograms['consume'].record(end - trace[3])
+			histograms['total'].record(end - trace[0])
+
+	"""
+	Returns the statistics as a dictionary:
+	{
+		'stages' : { stage : LatencyHistogram.to_dict() },
+		'queues' : [ { 'queue', 'depth', 'capacity', 'dropped' } ]
+	}
+	"""
+	def stats(self):
+		return {
+			'stages' : dict((stage, histogram.to_dict()) \
+				for stage, histogram in self.histograms.items()),
+			'queues' : [ {
+				'queue' : queue.name,
+				'depth' : queue.qsize(),
+				'capacity' : queue.maxsize,
+				'dropped' : queue.dropped
+				} for queue in self._queues ]
+		}
+
+	"""
+	Clears all the histograms
+	"""
+	def reset(self):
+		for histogram in self.histograms.values():
+			histogram.reset()
@@ -52,8 +52,8 @@ class Scheduler(threading.Thread):
 	"""
 	def run(self):
 		while self._can_run:
-			self._can_execute = self._execute_event.wait(2)
-	   		if self._can_execute is True:
+			self._can_execute = self._execute_event.wait()
+	   		if self._can_run and self._can_execute is True:
 	   			self._execute()
 
 	"""
@@ -85,6 +85,7 @@ class Scheduler(threading.Thread):
 	def kill(self):
 		self.stop()
 		self._can_run = False
+		self._execute_event.set()
 
 	"""
 	Create the periodic task schedule by adding to the tasks dictionaries
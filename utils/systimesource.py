@@ -8,18 +8,56 @@ __email__ 	= "dario.fiumicello@gmail.com"
 from datetime import datetime
 import dateutil.parser
 import os
+import time
 
 class SYSTimesource():
 	"""
 	The purpose of this class is to act as a Timesource for the event manager.
 	providing the system time.
 	See EventManager
+
+	The event manager takes just a float timestamp per event through
+	get_timestamp(), and the ISO 8601 time is built by format_time() only
+	when someone reads it. Since many events share the same second, the
+	formatted date and time up to the seconds is cached and only the
+	microseconds are formatted for every call.
 	"""
 	def __init__(self):
-		pass
+		# (second, "YYYY-MM-DDTHH:MM:SS" prefix) of the last formatted second.
+		# It is replaced as a whole, since consumer threads may format times
+		# at the same time.
+		self._second_cache = (None, None)
 	
 	"""
 	The standard method used by the event manager to get the current time
 	"""
   	def get_time(self):
 		return datetime.utcnow().isoformat()+"Z"
+
+	"""
+	Returns the current time as seconds since the epoch. The event manager
+	prefers it to get_time(), formatting the time only when needed through
+	format_time()
+	"""
+	def get_timestamp(self):
+		return time.time()
+
+	"""
+	Formats a timestamp returned by get_timestamp() like get_time() does
+	"""
+	def format_time(self,timestamp):
+		second = int(timestamp)
+		microsecond = int((timestamp - second) * 1000000 + 0.5)
+		if microsecond >= 1000000:
+			second += 1
+			microsecond -= 1000000
+
+		cached_second, prefix = self._second_cache
+		if second != cached_second:
+			prefix = datetime.utcfromtimestamp(second).isoformat()
+			self._second_cache = (second, prefix)
+
+		# As isoformat(), the microseconds are omitted when they are zero
+		if microsecond:
+			return "%s.%06dZ" % (prefix, microsecond)
+		return prefix+"Z"
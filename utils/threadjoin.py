@@ -0,0 +1,24 @@
+"""
+This module contains a helper to wait for a set of threads to terminate
+"""
+
+__author__ 	= "Dario Fiumicello"
+__email__ 	= "dario.fiumicello@gmail.com"
+
+import time
+
+"""
+Waits for all the given threads to terminate, for at most "timeout" seconds
+overall (forever if it is None). Anything with a join(timeout) method, like
+a multiprocessing.Process, can be passed, while objects without it are just
+ignored. Returns the list of the threads that are still alive.
+"""
+def join_all(threads,timeout=None):
+	threads = [thread for thread in threads if hasattr(thread, 'join')]
+	deadline = None if timeout is None else time.time() + timeout
+	for thread in threads:
+		if deadline is None:
+			thread.join()
+		else:
+			thread.join(max(deadline - time.time(), 0))
+	return [thread for thread in threads if thread.is_alive()]
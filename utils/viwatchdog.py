@@ -14,6 +14,10 @@ class VIWatchdog():
 	even if vi.is_alive() returns True it doesn't mean that VI is really
 	connected and working, especially when Bluetooth related error occurs.
 	"""
+
+	# Subscription to the EventManager
+	EVENT_TYPES = ('VI',)
+
 	def __init__(self):
 		self._vi_ok = False
 